@@ -10,6 +10,22 @@ class HealthAnalyzer:
     HEALTH_SATURATION_MIN = 80
     HEALTH_VALUE_MIN = 70
 
+    @staticmethod
+    def analyze_crops(crops):
+        """
+        Re-analyzes stored center crops, e.g. zero-copy views from the raw crop array.
+
+        The health ring sits well inside the crop, which is centered on the same pixel as the
+        screenshot. Sample points are rounded half-to-even, so each crop is padded to put that
+        pixel at an even coordinate, as it is on common screen resolutions; the ring is then
+        sampled exactly as it was at capture time.
+
+        Returns:
+            A list with one 'health_percent' value (float or "wrecked") per crop.
+        """
+        pad = HealthAnalyzer.CROP_BOX_SIZE // 2
+        return [HealthAnalyzer.analyze(cv2.copyMakeBorder(crop, pad, pad, pad, pad, cv2.BORDER_CONSTANT))["health_percent"] for crop in crops]
+
     @staticmethod
     def analyze(full_image_cv):
         """
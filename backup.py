@@ -0,0 +1,83 @@
+import sqlite3
+import os
+import threading
+from datetime import datetime
+
+class DatabaseBackup:
+    """
+    Online backup of the tracker database built on sqlite3.Connection.backup.
+
+    The copy runs on its own connection in a background thread and moves a few pages per
+    step, sleeping in between so the UI's connection is never locked out for long. SQLite
+    restarts the copy if the source is written mid-backup, so every finished file is a
+    consistent snapshot.
+    """
+    PAGES_PER_STEP = 64
+    STEP_SLEEP_S = 0.005
+    FILE_PREFIX = "vulture_tracker_backup_"
+    FILE_SUFFIX = ".db"
+
+    def __init__(self, db_path, backup_folder, retention=7):
+        self.db_path = db_path
+        self.backup_folder = backup_folder
+        self.retention = retention
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, progress_callback=None, done_callback=None):
+        """
+        Starts a backup in a background thread. Returns False if one is already running.
+
+        Both callbacks are invoked from the worker thread:
+        - progress_callback(pages_copied, total_pages)
+        - done_callback(backup_path, error), where exactly one of the two is None.
+        """
+        if self.is_running(): return False
+        self._thread = threading.Thread(target=self._run, args=(progress_callback, done_callback), daemon=True)
+        self._thread.start()
+        return True
+
+    def latest_backup_time(self):
+        backups = self.list_backups()
+        return datetime.fromtimestamp(os.path.getmtime(backups[-1])) if backups else None
+
+    def list_backups(self):
+        """Returns existing backup paths, oldest first."""
+        if not os.path.isdir(self.backup_folder): return []
+        names = sorted(n for n in os.listdir(self.backup_folder) if n.startswith(self.FILE_PREFIX) and n.endswith(self.FILE_SUFFIX))
+        return [os.path.join(self.backup_folder, n) for n in names]
+
+    def _run(self, progress_callback, done_callback):
+        os.makedirs(self.backup_folder, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        backup_path = os.path.join(self.backup_folder, f"{self.FILE_PREFIX}{stamp}{self.FILE_SUFFIX}")
+        partial_path = backup_path + ".partial"
+
+        def on_progress(status, remaining, total):
+            if progress_callback: progress_callback(total - remaining, total)
+
+        try:
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(partial_path)
+            try:
+                source.backup(target, pages=self.PAGES_PER_STEP, progress=on_progress, sleep=self.STEP_SLEEP_S)
+            finally:
+                target.close()
+                source.close()
+            # Only a completed copy ever gets the final name.
+            os.replace(partial_path, backup_path)
+            self._rotate()
+        except Exception as e:
+            if os.path.exists(partial_path): os.remove(partial_path)
+            if done_callback: done_callback(None, e)
+            return
+        if done_callback: done_callback(backup_path, None)
+
+    def _rotate(self):
+        for old_path in self.list_backups()[:-self.retention] if self.retention > 0 else []:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                print(f"Error removing old backup: {e}")
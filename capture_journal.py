@@ -0,0 +1,129 @@
+import os
+import math
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+import numpy as np
+
+class CaptureJournal:
+    """
+    Append-only journal of analyzed captures that have not been saved to the database yet.
+
+    Every capture is appended as soon as it is analyzed; once it is saved and its crop is
+    durable (written by the writer pool, when one is used) the entry is marked consumed
+    with a small follow-up record. On startup, `replay()` returns the
+    entries that were never consumed, so a freeze or crash between capture and save loses
+    nothing. Appends only hit the OS page cache; a background thread fsyncs them in groups,
+    at most GROUP_COMMIT_S after the first unsynced write.
+
+    Record layout (little-endian): magic, kind, seq, timestamp, health, crop height, width,
+    channels, payload length, CRC32 of everything before it plus the payload. A torn or
+    corrupt tail is discarded on replay.
+    """
+    MAGIC = b"VTJ1"
+    KIND_CAPTURE = 1
+    KIND_CONSUMED = 2
+    GROUP_COMMIT_S = 0.05
+    _HEADER = struct.Struct("<4sBQddHHBI")
+    _CRC = struct.Struct("<I")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._pending = {}
+        self._next_seq = 1
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        self._load()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def replay(self):
+        """Returns the captures that were journaled but never consumed, oldest first."""
+        with self._lock:
+            return [dict(self._pending[seq]) for seq in sorted(self._pending)]
+
+    def append(self, capture):
+        """Journals an analyzer result and returns its sequence number."""
+        crop = np.ascontiguousarray(capture["center_crop"], dtype=np.uint8)
+        height, width = crop.shape[:2]
+        channels = crop.shape[2] if crop.ndim == 3 else 1
+        health = capture["health_percent"]
+        health_value = float("nan") if isinstance(health, str) else float(health)
+        with self._lock:
+            seq = self._next_seq; self._next_seq += 1
+            self._write(self.KIND_CAPTURE, seq, capture["timestamp"].timestamp(), health_value, (height, width, channels), crop.tobytes())
+            self._pending[seq] = dict(capture, journal_seq=seq)
+        return seq
+
+    def mark_consumed(self, seq):
+        """Records that a journaled capture has been saved or superseded."""
+        with self._lock:
+            if self._pending.pop(seq, None) is None: return
+            if self._pending:
+                self._write(self.KIND_CONSUMED, seq, 0.0, 0.0, (0, 0, 0), b"")
+            else:
+                # Nothing left to replay, so the whole journal can go.
+                os.ftruncate(self._fd, 0)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                self._dirty.set()
+
+    def flush(self):
+        # Only the dirty flag is swapped under the lock, so an append on the Tk thread never
+        # waits for the disk; anything written after the swap sets it again for the next fsync.
+        with self._lock:
+            self._dirty.clear()
+        os.fsync(self._fd)
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._dirty.set()
+        self._flusher.join()
+        self.flush()
+        os.close(self._fd)
+
+    def _write(self, kind, seq, timestamp, health, shape, payload):
+        header = self._HEADER.pack(self.MAGIC, kind, seq, timestamp, health, shape[0], shape[1], shape[2], len(payload))
+        crc = zlib.crc32(payload, zlib.crc32(header))
+        os.write(self._fd, header + payload + self._CRC.pack(crc))
+        self._dirty.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            if self._closed: break
+            # Let the writes that arrive within the window share one fsync.
+            time.sleep(self.GROUP_COMMIT_S)
+            self.flush()
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        offset, good_end = 0, 0
+        while offset + self._HEADER.size <= len(data):
+            magic, kind, seq, timestamp, health, height, width, channels, length = self._HEADER.unpack_from(data, offset)
+            payload_start = offset + self._HEADER.size
+            record_end = payload_start + length + self._CRC.size
+            if magic != self.MAGIC or record_end > len(data): break
+            payload = data[payload_start:payload_start + length]
+            (crc,) = self._CRC.unpack_from(data, payload_start + length)
+            if crc != zlib.crc32(payload, zlib.crc32(data[offset:payload_start])): break
+            if kind == self.KIND_CAPTURE:
+                self._pending[seq] = {
+                    "health_percent": "wrecked" if math.isnan(health) else health,
+                    "timestamp": datetime.fromtimestamp(timestamp),
+                    "center_crop": np.frombuffer(payload, dtype=np.uint8).reshape((height, width, channels)).copy(),
+                    "journal_seq": seq
+                }
+            elif kind == self.KIND_CONSUMED:
+                self._pending.pop(seq, None)
+            self._next_seq = max(self._next_seq, seq + 1)
+            offset = good_end = record_end
+        if good_end < len(data):
+            print(f"Capture journal: discarding {len(data) - good_end} bytes of incomplete records.")
+            os.ftruncate(self._fd, good_end)
+        os.lseek(self._fd, good_end, os.SEEK_SET)
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+
+class CropArray:
+    """
+    Raw capture crops kept in one memory-mapped `.npy` array of shape (slots, *crop_shape).
+
+    Every crop has the same shape, so a crop is just a slot index: reading it is a NumPy view
+    into the mapping with no decode and no copy. The array grows in place by GROW_SLOTS at a
+    time; `.npy` headers leave room for the first dimension to grow, so only the header and
+    the file length change. Views handed out before a grow keep pointing at the old mapping.
+
+    This is a fast path next to the encoded screenshots, not a replacement for them: writes
+    reach the disk when the OS flushes the mapping or on `flush()`.
+    """
+    GROW_SLOTS = 1024
+
+    def __init__(self, path, crop_shape, dtype=np.uint8):
+        self.path = path
+        self.crop_shape = tuple(crop_shape)
+        if os.path.exists(path):
+            self._array = np.load(path, mmap_mode="r+")
+            if self._array.shape[1:] != self.crop_shape or self._array.dtype != dtype:
+                raise ValueError(f"{os.path.basename(path)} holds {self._array.shape[1:]} {self._array.dtype} crops, not {self.crop_shape} {np.dtype(dtype)}.")
+        else:
+            self._array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(self.GROW_SLOTS,) + self.crop_shape)
+
+    @property
+    def capacity(self):
+        return self._array.shape[0]
+
+    @property
+    def array(self):
+        """The whole mapped array; slice it for zero-copy batches of consecutive slots."""
+        return self._array
+
+    def fits(self, crop):
+        return crop.shape == self.crop_shape
+
+    def put(self, slot, crop):
+        if slot >= self.capacity: self._grow(slot + 1)
+        self._array[slot] = crop
+
+    def view(self, slot):
+        return self._array[slot] if 0 <= slot < self.capacity else None
+
+    def flush(self):
+        self._array.flush()
+
+    def _grow(self, min_capacity):
+        capacity = -(-min_capacity // self.GROW_SLOTS) * self.GROW_SLOTS
+        dtype = self._array.dtype
+        self._array.flush()
+        self._array = None
+        npy = np.lib.format
+        with open(self.path, "r+b") as f:
+            version = npy.read_magic(f)
+            read_header, write_header = {(1, 0): (npy.read_array_header_1_0, npy.write_array_header_1_0),
+                                         (2, 0): (npy.read_array_header_2_0, npy.write_array_header_2_0)}[version]
+            read_header(f)
+            header_end = f.tell()
+            f.seek(0)
+            write_header(f, {"descr": npy.dtype_to_descr(dtype), "fortran_order": False, "shape": (capacity,) + self.crop_shape})
+            if f.tell() != header_end: raise IOError(f"{os.path.basename(self.path)} has no room left to grow its header.")
+            f.truncate(header_end + capacity * int(np.prod(self.crop_shape)) * dtype.itemsize)
+        self._array = np.load(self.path, mmap_mode="r+")
@@ -0,0 +1,132 @@
+import os
+import sys
+import pathlib
+import sqlite3
+import time
+import struct
+import cv2
+import numpy as np
+
+class CropCodec:
+    """
+    Encoding used for capture crops in the image packs, chosen with the 'crop_codec' config key.
+
+    Specs:
+    - "png" or "png:<0-9>": PNG at OpenCV's default or the given zlib compression level.
+    - "webp": lossless WebP.
+    - "raw": the pixels as they are behind a small shape header; no encode or decode cost.
+
+    Every format is lossless and `decode()` recognises all of them, so changing the codec
+    only affects crops saved afterwards.
+    """
+    DEFAULT = "png"
+    BENCHMARK_SPECS = ("png:0", "png:1", "png:3", "png:6", "png:9", "webp", "raw")
+    RAW_MAGIC = b"VTRAW1"
+    _RAW_HEADER = struct.Struct("<6sHHB")
+
+    def __init__(self, spec=DEFAULT):
+        name, _, level = spec.partition(":")
+        if name == "png":
+            self.extension, self.params = ".png", [cv2.IMWRITE_PNG_COMPRESSION, int(level)] if level else []
+        elif name == "webp" and not level:
+            self.extension, self.params = ".webp", [cv2.IMWRITE_WEBP_QUALITY, 101]
+        elif name == "raw" and not level:
+            self.extension, self.params = None, []
+        else:
+            raise ValueError(f"Unknown crop codec '{spec}'.")
+        self.spec = spec
+
+    def encode(self, image):
+        if self.extension is None:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            channels = image.shape[2] if image.ndim == 3 else 1
+            return self._RAW_HEADER.pack(self.RAW_MAGIC, image.shape[0], image.shape[1], channels) + image.tobytes()
+        ok, encoded = cv2.imencode(self.extension, image, self.params)
+        if not ok: raise IOError(f"Could not encode the screenshot as {self.spec}.")
+        return encoded.tobytes()
+
+    @classmethod
+    def decode(cls, data):
+        """Decodes bytes written by any codec, or any image format OpenCV reads, to a BGR array; None if unreadable."""
+        if not data: return None
+        if data[:len(cls.RAW_MAGIC)] == cls.RAW_MAGIC:
+            _, height, width, channels = cls._RAW_HEADER.unpack_from(data)
+            image = np.frombuffer(data, np.uint8, offset=cls._RAW_HEADER.size).reshape((height, width, channels))
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if channels == 1 else image
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+    def recompress(self, data):
+        """Re-encodes losslessly stored bytes with this codec when that is smaller; lossy formats such as JPEG are kept."""
+        if not (data.startswith(b"\x89PNG") or data[:len(self.RAW_MAGIC)] == self.RAW_MAGIC): return data
+        image = self.decode(data)
+        if image is None: return data
+        encoded = self.encode(image)
+        return encoded if len(encoded) < len(data) else data
+
+
+def benchmark(images, specs=CropCodec.BENCHMARK_SPECS):
+    """
+    Times every codec on the given images.
+
+    Returns:
+        A list of dicts, one per codec: 'spec', 'encode_us' and 'decode_us' (mean microseconds
+        per image) and 'bytes' (mean encoded size).
+    """
+    results = []
+    for spec in specs:
+        codec = CropCodec(spec)
+        started = time.perf_counter()
+        encoded = [codec.encode(image) for image in images]
+        encode_s = time.perf_counter() - started
+        started = time.perf_counter()
+        for data in encoded: CropCodec.decode(data)
+        decode_s = time.perf_counter() - started
+        count = max(len(images), 1)
+        results.append({"spec": spec, "encode_us": encode_s * 1e6 / count, "decode_us": decode_s * 1e6 / count,
+                        "bytes": sum(map(len, encoded)) / count})
+    return results
+
+
+def load_sample(db_path, image_folder, limit=2000):
+    """
+    Reads up to `limit` stored crops, from the image packs as well as from their own files, in
+    a stable order. The database is opened read-only and nothing in it is changed.
+    """
+    from database import DatabaseManager
+    from image_pack import ImagePack
+    from image_store import ImageStore
+    conn = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    packs = {DatabaseManager.PACK_TIER_HOT: ImagePack(os.path.join(image_folder, DatabaseManager.IMAGE_PACK_DIR)),
+             DatabaseManager.PACK_TIER_ARCHIVE: ImagePack(os.path.join(image_folder, DatabaseManager.ARCHIVE_PACK_DIR))}
+    store = ImageStore(os.path.join(image_folder, DatabaseManager.IMAGE_STORE_DIR))
+    try:
+        images = []
+        for ref, tier, segment, offset, length in conn.execute("SELECT ref, pack_tier, pack_segment, pack_offset, pack_length FROM images ORDER BY ref"):
+            if len(images) >= limit: break
+            if segment is not None:
+                data = packs[tier].read(segment, offset, length)
+            else:
+                path = ref if os.path.isabs(ref) else store.path_for(ref) if ImageStore.is_content_ref(ref) else os.path.join(image_folder, ref)
+                if not os.path.exists(path): continue
+                with open(path, "rb") as f:
+                    data = f.read()
+            image = CropCodec.decode(data)
+            if image is not None: images.append(image)
+        return images
+    finally:
+        conn.close()
+        for pack in packs.values(): pack.close()
+
+if __name__ == "__main__":
+    # Usage: python crop_codec.py [database] [image folder]
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "vulture_tracker_v3.db")
+    image_folder = sys.argv[2] if len(sys.argv) > 2 else os.path.join(script_dir, "vulture_tracker_images_v3")
+    if not os.path.exists(db_path): sys.exit(f"{db_path} not found.")
+    sample = load_sample(db_path, image_folder)
+    if not sample: sys.exit(f"No stored crops could be read from {db_path}.")
+    print(f"{len(sample)} crops from {db_path}\n")
+    print(f"{'codec':<8}{'encode us':>12}{'decode us':>12}{'bytes/crop':>12}")
+    for row in benchmark(sample):
+        print(f"{row['spec']:<8}{row['encode_us']:>12.1f}{row['decode_us']:>12.1f}{row['bytes']:>12.0f}")
+    print("\nSet the 'crop_codec' config key to the codec to use for new crops.")
@@ -1,13 +1,61 @@
 import sqlite3
 import os
+import time
+import numpy as np
 import cv2
 from datetime import datetime
 
+from analyzer import HealthAnalyzer
+from image_store import ImageStore
+from image_pack import ImagePack
+from crop_array import CropArray
+from crop_codec import CropCodec
+
 class DatabaseManager:
-    def __init__(self, db_path):
+    SCHEMA_VERSION = 14
+    # Health is stored as fixed-point hundredths of a percent.
+    HEALTH_SCALE = 100
+    ROLLUP_BUCKET_S = 3600
+    IMAGE_STORE_DIR = "store"
+    IMAGE_PACK_DIR = "packs"
+    ARCHIVE_PACK_DIR = "archive"
+    # images.pack_tier: which pack a packed crop lives in.
+    PACK_TIER_HOT = 0
+    PACK_TIER_ARCHIVE = 1
+    ARCHIVE_CODEC = CropCodec("webp")
+    RAW_CROP_FILE = "crops.npy"
+    THUMBNAIL_SIZE = 50
+    # Two captures of one object are near-duplicates when they are this close in time,
+    # health (in hundredths of a percent) and perceptual hash bits.
+    NEAR_DUPLICATE_WINDOW_S = 15 * 60
+    NEAR_DUPLICATE_HEALTH_CP = 50
+    NEAR_DUPLICATE_HASH_BITS = 4
+    # table: (entity name in the change log, key column, parent column)
+    CHANGE_TRACKED_TABLES = {
+        "sietches": ("sietch", "name", None),
+        "locations": ("location", "id", "sietch_name"),
+        "objects": ("object", "id", "location_fk"),
+        "history": ("history", "id", "object_fk"),
+    }
+
+    def __init__(self, db_path, image_folder=None):
+        self.image_folder = image_folder
+        self.image_store = ImageStore(os.path.join(image_folder, self.IMAGE_STORE_DIR)) if image_folder else None
+        self.image_pack = ImagePack(os.path.join(image_folder, self.IMAGE_PACK_DIR)) if image_folder else None
+        self.archive_pack = ImagePack(os.path.join(image_folder, self.ARCHIVE_PACK_DIR)) if image_folder else None
         self.conn = sqlite3.connect(db_path)
         self.conn.execute("PRAGMA foreign_keys = 1")
+        self.conn.create_function("compact_image_ref", 1, self._compact_image_ref, deterministic=True)
         self.create_tables()
+        self._load_name_index()
+        self.crop_codec = CropCodec(self.get_config("crop_codec") or CropCodec.DEFAULT)
+        # Optional raw crop array, enabled with the 'raw_crop_store' config key.
+        self.crop_array = None
+        # Key of the last row each fill_* method examined, by method.
+        self._fill_after = {}
+        if image_folder and self.get_config("raw_crop_store") == "1":
+            size = HealthAnalyzer.CROP_BOX_SIZE
+            self.crop_array = CropArray(os.path.join(image_folder, self.RAW_CROP_FILE), (size, size, 3))
 
     def query(self, sql, params=()):
         return self.conn.cursor().execute(sql, params)
@@ -16,15 +64,580 @@ class DatabaseManager:
         self.conn.commit()
 
     def create_tables(self):
-        # (This method remains unchanged)
         cursor = self.conn.cursor()
         cursor.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT)')
         cursor.execute('CREATE TABLE IF NOT EXISTS sietches (name TEXT PRIMARY KEY)')
         cursor.execute('''CREATE TABLE IF NOT EXISTS locations (id INTEGER PRIMARY KEY, sietch_name TEXT, location_id TEXT, pin_x INTEGER, pin_y INTEGER, FOREIGN KEY(sietch_name) REFERENCES sietches(name) ON DELETE CASCADE, UNIQUE(sietch_name, location_id))''')
         cursor.execute('''CREATE TABLE IF NOT EXISTS objects (id INTEGER PRIMARY KEY, location_fk INTEGER, object_id TEXT, FOREIGN KEY(location_fk) REFERENCES locations(id) ON DELETE CASCADE, UNIQUE(location_fk, object_id))''')
-        cursor.execute('''CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, object_fk INTEGER, timestamp INTEGER, health_percent REAL, screenshot_path TEXT, FOREIGN KEY(object_fk) REFERENCES objects(id) ON DELETE CASCADE)''')
         self.conn.commit()
 
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            migrated = self._run_migration(1, self._migrate_history_clustered)
+            # Reclaims the old table's pages; only an optimization, so it is not part of the step.
+            if migrated: self.conn.execute("VACUUM")
+        if version < 2: self._run_migration(2, self._build_rollups)
+        if version < 3:
+            # VACUUM cannot run inside a transaction. It is safe to repeat, so the version is
+            # only recorded once it has succeeded.
+            self._enable_incremental_vacuum()
+            self._run_migration(3, lambda cursor: None)
+        if version < 4:
+            # Set while a background writer still owns the screenshot; the reference is not valid until cleared.
+            self._run_migration(4, lambda cursor: self._add_column(cursor, "history", "image_pending", "INTEGER NOT NULL DEFAULT 0"))
+        if version < 5: self._run_migration(5, self._create_images_table)
+        if version < 6: self._run_migration(6, self._add_pack_location_columns)
+        if version < 7: self._run_migration(7, self._add_crop_slot_column)
+        if version < 8:
+            # PNG thumbnails ready for the history panel, one per stored screenshot.
+            self._run_migration(8, lambda cursor: cursor.execute('CREATE TABLE IF NOT EXISTS thumbnails (ref TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID'))
+        if version < 9:
+            # Screenshot files no longer referenced, waiting for the background reaper to unlink them.
+            self._run_migration(9, lambda cursor: cursor.execute('CREATE TABLE IF NOT EXISTS file_tombstones (ref TEXT PRIMARY KEY) WITHOUT ROWID'))
+        if version < 10: self._run_migration(10, self._add_pack_tier_column)
+        if version < 11:
+            # Perceptual hash of the crop; candidates for comparison come from the clustered (object_fk, timestamp) key.
+            self._run_migration(11, lambda cursor: self._add_column(cursor, "history", "phash", "INTEGER"))
+        if version < 12: self._run_migration(12, self._build_decay_sums)
+        if version < 13: self._run_migration(13, self._build_free_crop_slots)
+        if version < 14:
+            # Finds the rows waiting on a crop that is still being written.
+            self._run_migration(14, lambda cursor: cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_pending_image ON history (image_ref) WHERE image_pending = 1"))
+        self._create_change_log(cursor)
+        self._create_rollup_triggers(cursor)
+        self._create_image_refcount_triggers(cursor)
+        self._create_decay_triggers(cursor)
+        self._create_crop_slot_triggers(cursor)
+        self.conn.commit()
+
+    def _create_change_log(self, cursor):
+        """Logs changes with triggers, so cascaded deletes are recorded too; a sietch rename logs a delete and an insert."""
+        cursor.execute('''CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL, key, parent, op TEXT NOT NULL)''')
+        # Consumers of the log and the last sequence number each has applied. Kept in the file, so
+        # a second process opening it never drops changes the running app has not seen yet.
+        cursor.execute('CREATE TABLE IF NOT EXISTS change_consumers (name TEXT PRIMARY KEY, seq INTEGER NOT NULL) WITHOUT ROWID')
+        for table, (entity, key, parent) in self.CHANGE_TRACKED_TABLES.items():
+            new_parent, old_parent = (f"NEW.{parent}", f"OLD.{parent}") if parent else ("NULL", "NULL")
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_log_insert AFTER INSERT ON {table} BEGIN
+                                 INSERT INTO changes (entity, key, parent, op) VALUES ('{entity}', NEW.{key}, {new_parent}, 'insert');
+                               END''')
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_log_update AFTER UPDATE ON {table} BEGIN
+                                 INSERT INTO changes (entity, key, parent, op) SELECT '{entity}', OLD.{key}, {old_parent}, 'delete' WHERE OLD.{key} IS NOT NEW.{key};
+                                 INSERT INTO changes (entity, key, parent, op) VALUES ('{entity}', NEW.{key}, {new_parent}, CASE WHEN OLD.{key} IS NEW.{key} THEN 'update' ELSE 'insert' END);
+                               END''')
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_log_delete AFTER DELETE ON {table} BEGIN
+                                 INSERT INTO changes (entity, key, parent, op) VALUES ('{entity}', OLD.{key}, {old_parent}, 'delete');
+                               END''')
+
+    def _create_history_table(self, cursor):
+        # Clustered on (object_fk, timestamp) so one object's points sit on adjacent pages.
+        # The trailing id keeps the key unique when two captures share a second.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS history (
+                            object_fk INTEGER NOT NULL, timestamp INTEGER NOT NULL, id INTEGER NOT NULL UNIQUE,
+                            health_cp INTEGER NOT NULL, image_ref TEXT,
+                            PRIMARY KEY (object_fk, timestamp, id),
+                            FOREIGN KEY(object_fk) REFERENCES objects(id) ON DELETE CASCADE) WITHOUT ROWID''')
+
+    def _run_migration(self, version, step):
+        """Runs one schema step and its user_version update in one transaction; a failed step is retried on the next start."""
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            result = step(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return result
+
+    @staticmethod
+    def _add_column(cursor, table, column, declaration):
+        # ALTER TABLE ADD COLUMN fails if the column exists, so check first to keep the step repeatable.
+        if column not in {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _migrate_history_clustered(self, cursor):
+        """Moves the old rowid history table to the clustered layout; returns True if there was one."""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(history)")}
+        old_table = "health_percent" in columns
+        if old_table:
+            cursor.execute("ALTER TABLE history RENAME TO history_v0")
+        self._create_history_table(cursor)
+        if old_table:
+            cursor.execute(f"""INSERT INTO history (object_fk, timestamp, id, health_cp, image_ref)
+                              SELECT object_fk, timestamp, id, CAST(ROUND(health_percent * {self.HEALTH_SCALE}) AS INTEGER), compact_image_ref(screenshot_path)
+                              FROM history_v0 WHERE object_fk IS NOT NULL AND timestamp IS NOT NULL""")
+            cursor.execute("DROP TABLE history_v0")
+        return old_table
+
+    def _create_images_table(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS images (ref TEXT PRIMARY KEY, refcount INTEGER NOT NULL) WITHOUT ROWID')
+        cursor.execute("INSERT OR REPLACE INTO images (ref, refcount) SELECT image_ref, COUNT(*) FROM history WHERE image_ref IS NOT NULL GROUP BY image_ref")
+
+    def _add_pack_location_columns(self, cursor):
+        # Where a crop lives in the image pack; NULL for crops stored as individual files.
+        for column in ("pack_segment", "pack_offset", "pack_length"):
+            self._add_column(cursor, "images", column, "INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_pack_segment ON images (pack_segment) WHERE pack_segment IS NOT NULL")
+
+    def _add_crop_slot_column(self, cursor):
+        # Slot of the crop in the raw crop array, if it has been copied there.
+        self._add_column(cursor, "history", "crop_slot", "INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_crop_slot ON history (crop_slot) WHERE crop_slot IS NOT NULL")
+
+    def _add_pack_tier_column(self, cursor):
+        self._add_column(cursor, "images", "pack_tier", f"INTEGER NOT NULL DEFAULT {self.PACK_TIER_HOT}")
+        cursor.execute("DROP INDEX IF EXISTS idx_images_pack_segment")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_images_pack_segment ON images (pack_tier, pack_segment) WHERE pack_segment IS NOT NULL")
+
+    def _create_rollup_tables(self, cursor):
+        # Hourly min/max/last health and point count per object and per location. object_hourly
+        # carries the location so location buckets can be rebuilt even while an object is being
+        # cascade-deleted.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS object_hourly (
+                            object_fk INTEGER NOT NULL, hour INTEGER NOT NULL, location_fk INTEGER,
+                            min_cp INTEGER, max_cp INTEGER, last_cp INTEGER, last_ts INTEGER, n INTEGER NOT NULL,
+                            PRIMARY KEY (object_fk, hour)) WITHOUT ROWID''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_object_hourly_location ON object_hourly (location_fk, hour)')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS location_hourly (
+                            location_fk INTEGER NOT NULL, hour INTEGER NOT NULL,
+                            min_cp INTEGER, max_cp INTEGER, last_cp INTEGER, last_ts INTEGER, n INTEGER NOT NULL,
+                            PRIMARY KEY (location_fk, hour)) WITHOUT ROWID''')
+
+    def _build_rollups(self, cursor):
+        """Creates the hourly rollup tables and backfills them from the existing history."""
+        bucket = self.ROLLUP_BUCKET_S
+        self._create_rollup_tables(cursor)
+        cursor.execute("DELETE FROM object_hourly")
+        cursor.execute("DELETE FROM location_hourly")
+        cursor.execute(f'''INSERT INTO object_hourly (object_fk, hour, location_fk, min_cp, max_cp, last_cp, last_ts, n)
+                           SELECT object_fk, hour, location_fk, MIN(health_cp), MAX(health_cp), MAX(CASE WHEN rn = 1 THEN health_cp END), MAX(timestamp), COUNT(*)
+                           FROM (SELECT h.object_fk, h.timestamp / {bucket} AS hour, o.location_fk, h.health_cp, h.timestamp,
+                                        ROW_NUMBER() OVER (PARTITION BY h.object_fk, h.timestamp / {bucket} ORDER BY h.timestamp DESC, h.id DESC) AS rn
+                                 FROM history h JOIN objects o ON h.object_fk = o.id)
+                           GROUP BY object_fk, hour''')
+        # The location's last point is the last point of its latest object bucket, as in the triggers.
+        cursor.execute('''INSERT OR REPLACE INTO location_hourly (location_fk, hour, min_cp, max_cp, last_cp, last_ts, n)
+                          SELECT location_fk, hour, MIN(min_cp), MAX(max_cp), MAX(CASE WHEN rn = 1 THEN last_cp END), MAX(last_ts), SUM(n)
+                          FROM (SELECT location_fk, hour, min_cp, max_cp, last_cp, last_ts, n,
+                                       ROW_NUMBER() OVER (PARTITION BY location_fk, hour ORDER BY last_ts DESC, object_fk DESC) AS rn
+                                FROM object_hourly)
+                          GROUP BY location_fk, hour''')
+
+    def _create_rollup_triggers(self, cursor):
+        """Keeps the rollups current: inserts fold into their bucket, deletes and edits rebuild it from history."""
+        bucket = self.ROLLUP_BUCKET_S
+
+        def rebuild_object_bucket(row):
+            in_bucket = f"object_fk = {row}.object_fk AND timestamp >= ({row}.timestamp / {bucket}) * {bucket} AND timestamp < ({row}.timestamp / {bucket} + 1) * {bucket}"
+            return f'''UPDATE object_hourly SET
+                           min_cp = (SELECT MIN(health_cp) FROM history WHERE {in_bucket}),
+                           max_cp = (SELECT MAX(health_cp) FROM history WHERE {in_bucket}),
+                           last_cp = (SELECT health_cp FROM history WHERE {in_bucket} ORDER BY timestamp DESC, id DESC LIMIT 1),
+                           last_ts = (SELECT MAX(timestamp) FROM history WHERE {in_bucket}),
+                           n = (SELECT COUNT(*) FROM history WHERE {in_bucket})
+                       WHERE object_fk = {row}.object_fk AND hour = {row}.timestamp / {bucket};
+                       DELETE FROM object_hourly WHERE object_fk = {row}.object_fk AND hour = {row}.timestamp / {bucket} AND n = 0;'''
+
+        def fold_into_object_bucket(row):
+            return f'''INSERT INTO object_hourly (object_fk, hour, location_fk, min_cp, max_cp, last_cp, last_ts, n)
+                           SELECT {row}.object_fk, {row}.timestamp / {bucket}, location_fk, {row}.health_cp, {row}.health_cp, {row}.health_cp, {row}.timestamp, 1
+                           FROM objects WHERE id = {row}.object_fk
+                       ON CONFLICT (object_fk, hour) DO UPDATE SET
+                           min_cp = MIN(min_cp, excluded.min_cp), max_cp = MAX(max_cp, excluded.max_cp),
+                           last_cp = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_cp ELSE last_cp END,
+                           last_ts = MAX(last_ts, excluded.last_ts), n = n + 1;'''
+
+        def rebuild_location_bucket(row):
+            in_bucket = f"location_fk = {row}.location_fk AND hour = {row}.hour"
+            return f'''INSERT INTO location_hourly (location_fk, hour, n) VALUES ({row}.location_fk, {row}.hour, 0) ON CONFLICT DO NOTHING;
+                       UPDATE location_hourly SET
+                           min_cp = (SELECT MIN(min_cp) FROM object_hourly WHERE {in_bucket}),
+                           max_cp = (SELECT MAX(max_cp) FROM object_hourly WHERE {in_bucket}),
+                           last_cp = (SELECT last_cp FROM object_hourly WHERE {in_bucket} ORDER BY last_ts DESC LIMIT 1),
+                           last_ts = (SELECT MAX(last_ts) FROM object_hourly WHERE {in_bucket}),
+                           n = (SELECT COALESCE(SUM(n), 0) FROM object_hourly WHERE {in_bucket})
+                       WHERE {in_bucket};
+                       DELETE FROM location_hourly WHERE {in_bucket} AND n = 0;'''
+
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_rollup_insert AFTER INSERT ON history BEGIN {fold_into_object_bucket('NEW')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_rollup_delete AFTER DELETE ON history BEGIN {rebuild_object_bucket('OLD')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_rollup_update AFTER UPDATE OF object_fk, timestamp, health_cp ON history BEGIN {rebuild_object_bucket('OLD')} END")
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS history_rollup_move AFTER UPDATE OF object_fk, timestamp ON history
+                           WHEN NEW.object_fk IS NOT OLD.object_fk OR NEW.timestamp / {bucket} IS NOT OLD.timestamp / {bucket}
+                           BEGIN
+                             INSERT INTO object_hourly (object_fk, hour, location_fk, n) SELECT NEW.object_fk, NEW.timestamp / {bucket}, location_fk, 0
+                                 FROM objects WHERE id = NEW.object_fk ON CONFLICT DO NOTHING;
+                             {rebuild_object_bucket('NEW')}
+                           END''')
+        for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS object_hourly_{op.lower()} AFTER {op} ON object_hourly BEGIN {rebuild_location_bucket(row)} END")
+
+    def _build_decay_sums(self, cursor):
+        # Least-squares sums of health (percent) against hours since the object's first point.
+        # Sums can be taken back out exactly, which is what lets deletes and edits roll a point back.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS object_decay (
+                            object_fk INTEGER PRIMARY KEY REFERENCES objects(id) ON DELETE CASCADE,
+                            origin_ts INTEGER NOT NULL, n INTEGER NOT NULL,
+                            sum_t REAL NOT NULL, sum_h REAL NOT NULL, sum_tt REAL NOT NULL, sum_th REAL NOT NULL)''')
+        scale = self.HEALTH_SCALE
+        cursor.execute(f'''INSERT OR REPLACE INTO object_decay (object_fk, origin_ts, n, sum_t, sum_h, sum_tt, sum_th)
+                           SELECT h.object_fk, o.origin_ts, COUNT(*),
+                                  SUM((h.timestamp - o.origin_ts) / 3600.0), SUM(h.health_cp / {scale}.0),
+                                  SUM(((h.timestamp - o.origin_ts) / 3600.0) * ((h.timestamp - o.origin_ts) / 3600.0)),
+                                  SUM(((h.timestamp - o.origin_ts) / 3600.0) * (h.health_cp / {scale}.0))
+                           FROM history h JOIN (SELECT object_fk, MIN(timestamp) AS origin_ts FROM history GROUP BY object_fk) o
+                                ON h.object_fk = o.object_fk
+                           GROUP BY h.object_fk''')
+
+    def _create_decay_triggers(self, cursor):
+        """Keeps object_decay current by adding or subtracting one point's terms per change."""
+        scale = self.HEALTH_SCALE
+
+        def apply(row, sign):
+            t, h = f"(({row}.timestamp - origin_ts) / 3600.0)", f"({row}.health_cp / {scale}.0)"
+            return f'''UPDATE object_decay SET n = n {sign} 1, sum_t = sum_t {sign} {t}, sum_h = sum_h {sign} {h},
+                           sum_tt = sum_tt {sign} {t} * {t}, sum_th = sum_th {sign} {t} * {h}
+                       WHERE object_fk = {row}.object_fk;'''
+
+        def take(row):
+            return f'''INSERT INTO object_decay (object_fk, origin_ts, n, sum_t, sum_h, sum_tt, sum_th)
+                           VALUES ({row}.object_fk, {row}.timestamp, 0, 0, 0, 0, 0) ON CONFLICT DO NOTHING;
+                       {apply(row, '+')}'''
+
+        def release(row):
+            return f'''{apply(row, '-')}
+                       DELETE FROM object_decay WHERE object_fk = {row}.object_fk AND n <= 0;'''
+
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_decay_insert AFTER INSERT ON history BEGIN {take('NEW')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_decay_delete AFTER DELETE ON history BEGIN {release('OLD')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_decay_update AFTER UPDATE OF object_fk, timestamp, health_cp ON history BEGIN {release('OLD')} {take('NEW')} END")
+
+    def _create_image_refcount_triggers(self, cursor):
+        # images.refcount counts the history rows pointing at each screenshot; a row is dropped
+        # as soon as its count reaches zero, which is what lets deletes decide to unlink a file.
+        take = '''INSERT INTO images (ref, refcount) VALUES (NEW.image_ref, 1)
+                  ON CONFLICT (ref) DO UPDATE SET refcount = refcount + 1;'''
+        release = '''UPDATE images SET refcount = refcount - 1 WHERE ref = OLD.image_ref;
+                     DELETE FROM images WHERE ref = OLD.image_ref AND refcount <= 0;'''
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_image_take AFTER INSERT ON history WHEN NEW.image_ref IS NOT NULL BEGIN {take} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_image_release AFTER DELETE ON history WHEN OLD.image_ref IS NOT NULL BEGIN {release} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_image_retake_old AFTER UPDATE OF image_ref ON history WHEN OLD.image_ref IS NOT NULL AND OLD.image_ref IS NOT NEW.image_ref BEGIN {release} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_image_retake_new AFTER UPDATE OF image_ref ON history WHEN NEW.image_ref IS NOT NULL AND OLD.image_ref IS NOT NEW.image_ref BEGIN {take} END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS images_thumbnail_release AFTER DELETE ON images BEGIN DELETE FROM thumbnails WHERE ref = OLD.ref; END")
+        # Packed crops are reclaimed by compaction; only crops kept as their own file need unlinking.
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS images_file_tombstone AFTER DELETE ON images WHEN OLD.pack_segment IS NULL BEGIN INSERT OR IGNORE INTO file_tombstones (ref) VALUES (OLD.ref); END")
+
+    def _build_free_crop_slots(self, cursor):
+        # Slots of the crop array below the highest one in use that no history row holds.
+        cursor.execute('CREATE TABLE IF NOT EXISTS free_crop_slots (slot INTEGER PRIMARY KEY)')
+        cursor.execute('''WITH RECURSIVE slots (slot) AS (
+                              SELECT 0 WHERE EXISTS (SELECT 1 FROM history WHERE crop_slot IS NOT NULL)
+                              UNION ALL SELECT slot + 1 FROM slots WHERE slot < (SELECT MAX(crop_slot) FROM history WHERE crop_slot IS NOT NULL))
+                          INSERT OR IGNORE INTO free_crop_slots (slot)
+                          SELECT slot FROM slots WHERE NOT EXISTS (SELECT 1 FROM history WHERE crop_slot = slots.slot)''')
+
+    def _create_crop_slot_triggers(self, cursor):
+        # A slot goes back to free_crop_slots when its row lets go of it, and leaves it when a row takes it.
+        take = "DELETE FROM free_crop_slots WHERE slot = NEW.crop_slot;"
+        release = "INSERT OR IGNORE INTO free_crop_slots (slot) VALUES (OLD.crop_slot);"
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_crop_slot_take AFTER INSERT ON history WHEN NEW.crop_slot IS NOT NULL BEGIN {take} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_crop_slot_release AFTER DELETE ON history WHEN OLD.crop_slot IS NOT NULL BEGIN {release} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_crop_slot_retake_old AFTER UPDATE OF crop_slot ON history WHEN OLD.crop_slot IS NOT NULL AND OLD.crop_slot IS NOT NEW.crop_slot BEGIN {release} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS history_crop_slot_retake_new AFTER UPDATE OF crop_slot ON history WHEN NEW.crop_slot IS NOT NULL AND OLD.crop_slot IS NOT NEW.crop_slot BEGIN {take} END")
+
+    def _encode_thumbnail(self, image):
+        height, width = image.shape[:2]
+        scale = self.THUMBNAIL_SIZE / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".png", image)
+        if not ok: raise IOError("Could not encode the thumbnail.")
+        return encoded.tobytes()
+
+    def _store_thumbnail(self, image_ref, image):
+        self.query("INSERT OR IGNORE INTO thumbnails (ref, data) VALUES (?, ?)", (image_ref, self._encode_thumbnail(image)))
+
+    def _fill_batch(self, name, sql, batch_size, fill, start=0):
+        """Runs `fill` on the next `batch_size` rows of `sql`, keyed by their first column; returns how many were examined."""
+        rows = self.query(sql, (self._fill_after.get(name, start), batch_size)).fetchall()
+        for row in rows: fill(*row)
+        self.commit()
+        # Rows that cannot be filled (e.g. unreadable screenshots) are skipped until the next full pass.
+        self._fill_after[name] = rows[-1][0] if rows else start
+        return len(rows)
+
+    def fill_thumbnails(self, batch_size=64):
+        def fill(image_ref):
+            image = self.read_image(image_ref)
+            if image is not None: self._store_thumbnail(image_ref, image)
+        return self._fill_batch("thumbnails", """SELECT ref FROM images i WHERE ref > ? AND NOT EXISTS (SELECT 1 FROM thumbnails t WHERE t.ref = i.ref)
+                                                  ORDER BY ref LIMIT ?""", batch_size, fill, start="")
+
+    def _get_pack_location(self, image_ref):
+        """Returns (tier, segment, offset, length) for a packed crop, or None."""
+        row = self.query("SELECT pack_tier, pack_segment, pack_offset, pack_length FROM images WHERE ref = ? AND pack_segment IS NOT NULL", (image_ref,)).fetchone()
+        return tuple(row) if row else None
+
+    def _set_pack_location(self, image_ref, location, tier=PACK_TIER_HOT):
+        self.query("UPDATE images SET pack_tier = ?, pack_segment = ?, pack_offset = ?, pack_length = ? WHERE ref = ?", (tier, *location, image_ref))
+
+    def _pack_for_tier(self, tier):
+        return self.archive_pack if tier == self.PACK_TIER_ARCHIVE else self.image_pack
+
+    def is_image_pending(self, image_ref):
+        return self.query("SELECT 1 FROM history WHERE image_ref = ? AND image_pending = 1 LIMIT 1", (image_ref,)).fetchone() is not None
+
+    def _is_image_stored(self, image_ref):
+        if self._get_pack_location(image_ref): return True
+        # A tombstoned file may be unlinked at any moment, so it no longer counts.
+        if self.query("SELECT 1 FROM file_tombstones WHERE ref = ?", (image_ref,)).fetchone(): return False
+        path = self.resolve_image_path(image_ref)
+        return bool(path) and os.path.exists(path)
+
+    def read_image_bytes(self, image_ref):
+        """Returns the encoded screenshot for a reference, from the pack or its own file, or None."""
+        if not image_ref: return None
+        location = self._get_pack_location(image_ref)
+        if location: return self._pack_for_tier(location[0]).read(*location[1:])
+        path = self.resolve_image_path(image_ref)
+        if not path or not os.path.exists(path): return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def read_image(self, image_ref):
+        """Returns a screenshot decoded to a BGR array, or None if it is not available."""
+        return CropCodec.decode(self.read_image_bytes(image_ref))
+
+    def image_pack_segments_to_compact(self, min_dead_ratio=0.5):
+        """Returns (tier, segment) for the sealed pack segments whose share of deleted bytes is at least `min_dead_ratio`."""
+        if not self.image_pack: return []
+        live = {(tier, segment): size for tier, segment, size in self.query(
+            "SELECT pack_tier, pack_segment, SUM(pack_length) FROM images WHERE pack_segment IS NOT NULL GROUP BY pack_tier, pack_segment").fetchall()}
+        segments = []
+        for tier in (self.PACK_TIER_HOT, self.PACK_TIER_ARCHIVE):
+            pack = self._pack_for_tier(tier)
+            for segment in pack.list_segments():
+                size = pack.segment_size(segment)
+                if segment != pack.active_segment and size and 1 - live.get((tier, segment), 0) / size >= min_dead_ratio:
+                    segments.append((tier, segment))
+        return segments
+
+    def compact_image_pack_segment(self, tier, segment):
+        """Copies a segment's live crops to the active segment of its pack, then deletes it. Returns the bytes reclaimed."""
+        pack = self._pack_for_tier(tier)
+        size = pack.segment_size(segment)
+        rows = self.query("SELECT ref, pack_offset, pack_length FROM images WHERE pack_tier = ? AND pack_segment = ? ORDER BY pack_offset", (tier, segment)).fetchall()
+        try:
+            moved = 0
+            for ref, offset, length in rows:
+                self._set_pack_location(ref, pack.append(pack.read(segment, offset, length), sync=False), tier)
+                moved += length
+            # The copies must be durable before the index points at them.
+            pack.sync()
+            self.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        pack.remove_segment(segment)
+        return size - moved
+
+    def archive_images(self, cutoff_ts, limit, after_ref="", time_budget_s=None):
+        """Moves up to `limit` screenshots last used before `cutoff_ts` to the archive pack; returns the refs examined."""
+        if not self.archive_pack: return []
+        refs = [r[0] for r in self.query("""SELECT h.image_ref FROM history h JOIN images i ON i.ref = h.image_ref
+                                             WHERE h.image_ref > ? AND i.pack_tier = ?
+                                             GROUP BY h.image_ref HAVING MAX(h.timestamp) < ? AND MAX(h.image_pending) = 0
+                                             ORDER BY h.image_ref LIMIT ?""", (after_ref, self.PACK_TIER_HOT, int(cutoff_ts), limit)).fetchall()]
+        deadline = time.monotonic() + time_budget_s if time_budget_s is not None else None
+        examined = []
+        try:
+            files = []
+            for image_ref in refs:
+                if examined and deadline is not None and time.monotonic() >= deadline: break
+                examined.append(image_ref)
+                data = self.read_image_bytes(image_ref)
+                if data is None: continue
+                # Archived files are reaped; absolute paths of older versions live outside the folder and stay.
+                if not self._get_pack_location(image_ref) and not os.path.isabs(image_ref): files.append(image_ref)
+                self._set_pack_location(image_ref, self.archive_pack.append(self.ARCHIVE_CODEC.recompress(data), sync=False), self.PACK_TIER_ARCHIVE)
+            self.archive_pack.sync()
+            self.conn.executemany("INSERT OR IGNORE INTO file_tombstones (ref) VALUES (?)", ((ref,) for ref in files))
+            self.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return examined
+
+    def thin_history(self, obj_pk, cutoff_ts, per_day):
+        """Keeps at most `per_day` points per UTC day before `cutoff_ts`, always with the first and last two; returns how many were removed."""
+        cursor = self.query("""
+            DELETE FROM history WHERE object_fk = ? AND id IN (
+                SELECT id FROM (
+                    SELECT id, timestamp,
+                           ROW_NUMBER() OVER (PARTITION BY timestamp / 86400 ORDER BY timestamp, id) AS rn,
+                           COUNT(*) OVER (PARTITION BY timestamp / 86400) AS day_count,
+                           ROW_NUMBER() OVER (ORDER BY timestamp, id) AS pos,
+                           COUNT(*) OVER () AS total
+                    FROM history WHERE object_fk = ?
+                ) WHERE timestamp < ? AND pos > 1 AND pos < total - 1 AND ((rn - 1) * ?) % day_count >= ?
+            )""", (obj_pk, obj_pk, int(cutoff_ts), int(per_day), int(per_day)))
+        self.commit()
+        return cursor.rowcount
+
+    def get_object_pks(self):
+        return sorted(self._object_keys)
+
+    def _next_crop_slot(self):
+        # Slots freed by deletes are reused first, lowest first; otherwise the array grows by one.
+        # Both are single index lookups. The slot stays free until a history row takes it.
+        free = self.query("SELECT MIN(slot) FROM free_crop_slots").fetchone()[0]
+        if free is not None: return free
+        return self.query("SELECT COALESCE(MAX(crop_slot) + 1, 0) FROM history WHERE crop_slot IS NOT NULL").fetchone()[0]
+
+    def _put_raw_crop(self, crop):
+        """Copies a crop into a free slot of the crop array and returns the slot, or None."""
+        if not self.crop_array or not self.crop_array.fits(crop): return None
+        slot = self._next_crop_slot()
+        self.crop_array.put(slot, crop)
+        return slot
+
+    def get_crop(self, history_id):
+        """Returns a zero-copy view of a data point's raw crop, or None if it is not in the crop array."""
+        if not self.crop_array: return None
+        row = self.query("SELECT crop_slot FROM history WHERE id = ? AND crop_slot IS NOT NULL", (history_id,)).fetchone()
+        return self.crop_array.view(row[0]) if row else None
+
+    def iter_crops(self, obj_pk=None):
+        """Yields (history_id, crop view) for every data point in the crop array, optionally for one object."""
+        if not self.crop_array: return
+        where, params = ("AND object_fk = ?", (obj_pk,)) if obj_pk is not None else ("", ())
+        for history_id, slot in self.query(f"SELECT id, crop_slot FROM history WHERE crop_slot IS NOT NULL {where} ORDER BY crop_slot", params).fetchall():
+            yield history_id, self.crop_array.view(slot)
+
+    def fill_crop_array(self, batch_size=256):
+        if not self.crop_array: return 0
+        def fill(history_id, image_ref):
+            crop = self.read_image(image_ref)
+            slot = self._put_raw_crop(crop) if crop is not None else None
+            if slot is not None: self.query("UPDATE history SET crop_slot = ? WHERE id = ?", (slot, history_id))
+        return self._fill_batch("crop_array", """SELECT id, image_ref FROM history WHERE crop_slot IS NULL AND image_ref IS NOT NULL
+                                                  AND image_pending = 0 AND id > ? ORDER BY id LIMIT ?""", batch_size, fill)
+
+    def get_file_tombstones(self, limit):
+        """Returns up to `limit` (image_ref, path) pairs of screenshot files waiting to be unlinked."""
+        rows = self.query("SELECT ref FROM file_tombstones ORDER BY ref LIMIT ?", (limit,)).fetchall()
+        return [(ref, self.resolve_image_path(ref)) for (ref,) in rows]
+
+    def count_file_tombstones(self):
+        return self.query("SELECT COUNT(*) FROM file_tombstones").fetchone()[0]
+
+    def clear_file_tombstones(self, refs):
+        self.conn.executemany("DELETE FROM file_tombstones WHERE ref = ?", ((ref,) for ref in refs)); self.commit()
+
+    def get_image_file_refs(self):
+        """Returns {path: image_ref} for every referenced screenshot stored as its own file and not still being written."""
+        rows = self.query("""SELECT ref FROM images WHERE pack_segment IS NULL
+                              AND ref NOT IN (SELECT image_ref FROM history WHERE image_pending = 1 AND image_ref IS NOT NULL)""").fetchall()
+        return {self.resolve_image_path(ref): ref for (ref,) in rows}
+
+    def tombstone_image_files(self, paths):
+        """Queues unreferenced screenshot files, e.g. orphans found by a scan, for the background reaper."""
+        self.conn.executemany("INSERT OR IGNORE INTO file_tombstones (ref) VALUES (?)", ((self._file_image_ref(path),) for path in paths)); self.commit()
+
+    def _file_image_ref(self, path):
+        # A file in the content-addressed store is known by its hash, like the references saved for it.
+        name = os.path.splitext(os.path.basename(path))[0]
+        if self.image_store and ImageStore.is_content_ref(name) and os.path.normcase(self.image_store.path_for(name)) == os.path.normcase(os.path.abspath(path)):
+            return name
+        return self._compact_image_ref(path)
+
+    def drop_image_refs(self, refs):
+        """Clears the given screenshot references from every data point, e.g. ones whose file is gone."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS dropped_image_refs (ref TEXT PRIMARY KEY)")
+        self.conn.executemany("INSERT OR IGNORE INTO dropped_image_refs (ref) VALUES (?)", ((ref,) for ref in refs))
+        cursor = self.query("UPDATE history SET image_ref = NULL WHERE image_ref IN (SELECT ref FROM dropped_image_refs)")
+        self.conn.execute("DELETE FROM dropped_image_refs"); self.commit()
+        return cursor.rowcount
+
+    def _enable_incremental_vacuum(self):
+        # Changing auto_vacuum on an existing file only takes effect after a full VACUUM.
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.conn.execute("VACUUM")
+
+    def _compact_image_ref(self, path):
+        """Stores screenshots inside the image folder by their path relative to it."""
+        if not path or not self.image_folder or not os.path.isabs(path): return path
+        rel_path = os.path.relpath(path, self.image_folder)
+        return path if rel_path.startswith(os.pardir) else rel_path
+
+    def resolve_image_path(self, image_ref):
+        if not image_ref or os.path.isabs(image_ref) or not self.image_folder: return image_ref
+        if ImageStore.is_content_ref(image_ref): return self.image_store.path_for(image_ref)
+        return os.path.join(self.image_folder, image_ref)
+
+    def _encode_health(self, health):
+        return int(round(float(health) * self.HEALTH_SCALE))
+
+    def latest_change_seq(self):
+        row = self.query("SELECT seq FROM sqlite_sequence WHERE name='changes'").fetchone()
+        return row[0] if row else 0
+
+    def register_change_consumer(self, name):
+        """Registers or restarts a consumer; returns the sequence number to apply changes_since() from."""
+        seq = self.latest_change_seq()
+        self.query("INSERT OR REPLACE INTO change_consumers (name, seq) VALUES (?, ?)", (name, seq))
+        self._compact_changes()
+        return seq
+
+    def unregister_change_consumer(self, name):
+        self.query("DELETE FROM change_consumers WHERE name = ?", (name,))
+        self._compact_changes()
+
+    def changes_since(self, seq):
+        """Returns (seq, entity, key, parent, op) rows logged after `seq`, oldest first."""
+        return self.query("SELECT seq, entity, key, parent, op FROM changes WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+
+    def ack_changes(self, name, seq):
+        """Records that consumer `name` has applied every change up to `seq`."""
+        self.query("UPDATE change_consumers SET seq = ? WHERE name = ?", (seq, name))
+        self._compact_changes()
+
+    def _compact_changes(self):
+        # Anything every registered consumer has seen is dead weight; with none registered, that is everything.
+        caught_up = self.query("SELECT MIN(seq) FROM change_consumers").fetchone()[0]
+        if caught_up is None: caught_up = self.latest_change_seq()
+        self.query("DELETE FROM changes WHERE seq <= ?", (caught_up,)); self.commit()
+
+    def _load_name_index(self):
+        """Loads the name <-> primary key index; objects are keyed by (location_pk, object_id), so a rename touches one entry."""
+        self._location_pks, self._location_keys = {}, {}
+        self._object_pks, self._object_keys = {}, {}
+        for loc_pk, sietch_name, location_id in self.query("SELECT id, sietch_name, location_id FROM locations").fetchall():
+            self._index_location(loc_pk, sietch_name, location_id)
+        for obj_pk, loc_fk, object_id in self.query("SELECT id, location_fk, object_id FROM objects").fetchall():
+            self._index_object(obj_pk, loc_fk, object_id)
+
+    def _index_location(self, loc_pk, sietch_name, location_id):
+        self._location_pks[(sietch_name, location_id)] = loc_pk
+        self._location_keys[loc_pk] = (sietch_name, location_id)
+        self._object_pks.setdefault(loc_pk, {})
+
+    def _unindex_location(self, loc_pk):
+        key = self._location_keys.pop(loc_pk, None)
+        if key: self._location_pks.pop(key, None)
+        for obj_pk in self._object_pks.pop(loc_pk, {}).values():
+            self._object_keys.pop(obj_pk, None)
+
+    def _index_object(self, obj_pk, loc_pk, object_id):
+        self._object_pks.setdefault(loc_pk, {})[object_id] = obj_pk
+        self._object_keys[obj_pk] = (loc_pk, object_id)
+
+    def _unindex_object(self, obj_pk):
+        key = self._object_keys.pop(obj_pk, None)
+        if key: self._object_pks.get(key[0], {}).pop(key[1], None)
+
     def get_config(self, key):
         row = self.query("SELECT value FROM config WHERE key=?", (key,)).fetchone()
         return row[0] if row else None
@@ -39,17 +652,105 @@ class DatabaseManager:
 
     def rename_sietch(self, old_name, new_name):
         try:
-            self.query("UPDATE sietches SET name=? WHERE name=?", (new_name, old_name)); self.commit(); return True, "Success"
+            self.query("UPDATE sietches SET name=? WHERE name=?", (new_name, old_name)); self.commit()
         except sqlite3.IntegrityError: return False, "New sietch name already exists."
+        for loc_pk, (sietch_name, location_id) in list(self._location_keys.items()):
+            if sietch_name == old_name:
+                del self._location_pks[(old_name, location_id)]
+                self._index_location(loc_pk, new_name, location_id)
+        return True, "Success"
 
     def delete_sietch(self, name):
         self.query("DELETE FROM sietches WHERE name=?", (name,)); self.commit()
+        # Locations, objects and history are removed by the CASCADE constraints; mirror that in the index.
+        for loc_pk in [pk for pk, (sietch_name, _) in self._location_keys.items() if sietch_name == name]:
+            self._unindex_location(loc_pk)
 
     def get_sietches(self):
         return [s[0] for s in self.query("SELECT name FROM sietches ORDER BY name").fetchall()]
 
+    def export_sietch_shard(self, sietch_name, shard_path):
+        """Writes one sietch with its history and screenshots to a standalone database file of the same schema."""
+        if sietch_name not in self.get_sietches(): return False, "Sietch not found."
+        if os.path.exists(shard_path): return False, "The shard file already exists."
+        DatabaseManager(shard_path, self.image_folder).close()
+
+        def copy(cursor):
+            cursor.execute("INSERT INTO shard.sietches (name) VALUES (?)", (sietch_name,))
+            cursor.execute("""INSERT INTO shard.locations (id, sietch_name, location_id, pin_x, pin_y)
+                              SELECT id, sietch_name, location_id, pin_x, pin_y FROM main.locations WHERE sietch_name = ?""", (sietch_name,))
+            cursor.execute("""INSERT INTO shard.objects (id, location_fk, object_id)
+                              SELECT o.id, o.location_fk, o.object_id FROM main.objects o JOIN shard.locations l ON o.location_fk = l.id""")
+            cursor.execute("""INSERT INTO shard.history (object_fk, timestamp, id, health_cp, image_ref, phash)
+                              SELECT h.object_fk, h.timestamp, h.id, h.health_cp, h.image_ref, h.phash FROM main.history h JOIN shard.objects o ON h.object_fk = o.id""")
+            # The shard's own change log saw every copied row; nothing is consuming it.
+            cursor.execute("DELETE FROM shard.changes")
+            cursor.execute("CREATE TABLE shard.image_data (ref TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+            for (image_ref,) in cursor.execute("SELECT ref FROM shard.images").fetchall():
+                data = self.read_image_bytes(image_ref)
+                if data: cursor.execute("INSERT INTO shard.image_data (ref, data) VALUES (?, ?)", (image_ref, data))
+            cursor.execute("INSERT INTO shard.thumbnails (ref, data) SELECT t.ref, t.data FROM main.thumbnails t JOIN shard.images i ON i.ref = t.ref")
+
+        success, msg = self._with_attached_shard(shard_path, copy)
+        if not success and os.path.exists(shard_path): os.remove(shard_path)
+        return success, msg
+
+    def import_sietch_shard(self, shard_path):
+        """Merges every sietch in a shard file into this database under fresh primary keys."""
+        if not os.path.exists(shard_path): return False, "Shard file not found."
+        # Opening the shard brings one written by an older version up to the current schema.
+        DatabaseManager(shard_path, self.image_folder).close()
+
+        def merge(cursor):
+            clashes = cursor.execute("SELECT name FROM shard.sietches WHERE name IN (SELECT name FROM main.sietches)").fetchall()
+            if clashes: raise sqlite3.IntegrityError(f"Sietch '{clashes[0][0]}' already exists.")
+            cursor.execute("INSERT INTO main.sietches (name) SELECT name FROM shard.sietches")
+            cursor.execute("""INSERT INTO main.locations (sietch_name, location_id, pin_x, pin_y)
+                              SELECT sietch_name, location_id, pin_x, pin_y FROM shard.locations""")
+            # Rows are matched to their new keys through the natural (sietch, location, object) names.
+            to_main_location = """JOIN shard.locations sl ON so.location_fk = sl.id
+                                   JOIN main.locations ml ON ml.sietch_name = sl.sietch_name AND ml.location_id = sl.location_id"""
+            cursor.execute(f"INSERT INTO main.objects (location_fk, object_id) SELECT ml.id, so.object_id FROM shard.objects so {to_main_location}")
+            first_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM main.history").fetchone()[0]
+            cursor.execute(f"""INSERT INTO main.history (object_fk, timestamp, id, health_cp, image_ref, phash)
+                               SELECT mo.id, sh.timestamp, ? + ROW_NUMBER() OVER (ORDER BY sh.id), sh.health_cp, sh.image_ref, sh.phash
+                               FROM shard.history sh JOIN shard.objects so ON sh.object_fk = so.id {to_main_location}
+                               JOIN main.objects mo ON mo.location_fk = ml.id AND mo.object_id = so.object_id""", (first_id,))
+            if self.image_pack and cursor.execute("SELECT 1 FROM shard.sqlite_master WHERE name = 'image_data'").fetchone():
+                for image_ref, data in cursor.execute("SELECT ref, data FROM shard.image_data").fetchall():
+                    if not self._is_image_stored(image_ref): self._set_pack_location(image_ref, self.image_pack.append(data, sync=False))
+                self.image_pack.sync()
+            cursor.execute("INSERT OR IGNORE INTO main.thumbnails (ref, data) SELECT ref, data FROM shard.thumbnails WHERE ref IN (SELECT ref FROM main.images)")
+
+        success, msg = self._with_attached_shard(shard_path, merge)
+        if success: self._load_name_index()
+        return success, msg
+
+    def archive_sietch(self, sietch_name, shard_path):
+        """Moves a sietch out of this database into its own shard file."""
+        success, msg = self.export_sietch_shard(sietch_name, shard_path)
+        if success: self.delete_sietch(sietch_name)
+        return success, msg
+
+    def _with_attached_shard(self, shard_path, work):
+        # ATTACH is not allowed inside a transaction, and the work must be all-or-nothing.
+        self.commit()
+        self.conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN")
+            work(cursor)
+            self.commit()
+            return True, "Success"
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            return False, str(e)
+        finally:
+            self.conn.execute("DETACH DATABASE shard")
+
     def add_location(self, sietch_name, location_id, pin_x=None, pin_y=None):
-        self.query("INSERT OR IGNORE INTO locations (sietch_name, location_id, pin_x, pin_y) VALUES (?, ?, ?, ?)", (sietch_name, location_id, pin_x, pin_y)); self.commit()
+        cursor = self.query("INSERT OR IGNORE INTO locations (sietch_name, location_id, pin_x, pin_y) VALUES (?, ?, ?, ?)", (sietch_name, location_id, pin_x, pin_y)); self.commit()
+        if cursor.rowcount == 1: self._index_location(cursor.lastrowid, sietch_name, location_id)
 
     def get_locations_for_sietch(self, sietch_name):
         return [l[0] for l in self.query("SELECT location_id FROM locations WHERE sietch_name=? ORDER BY location_id", (sietch_name,)).fetchall()]
@@ -64,72 +765,137 @@ class DatabaseManager:
         self.query("UPDATE locations SET pin_x=?, pin_y=? WHERE id=?", (x, y, loc_pk)); self.commit()
 
     def get_location_name(self, loc_pk):
-        row = self.query("SELECT location_id FROM locations WHERE id=?", (loc_pk,)).fetchone()
-        return row[0] if row else ""
+        key = self._location_keys.get(loc_pk)
+        return key[1] if key else ""
 
     def rename_location(self, loc_pk, new_id):
         try:
-            self.query("UPDATE locations SET location_id=? WHERE id=?", (new_id, loc_pk)); self.commit(); return True, "Success"
+            self.query("UPDATE locations SET location_id=? WHERE id=?", (new_id, loc_pk)); self.commit()
         except sqlite3.IntegrityError: return False, "A location with this ID already exists in this Sietch."
+        sietch_name, old_id = self._location_keys[loc_pk]
+        del self._location_pks[(sietch_name, old_id)]
+        self._index_location(loc_pk, sietch_name, new_id)
+        return True, "Success"
 
     def delete_location(self, loc_pk):
-        # Get all screenshot paths for all objects under this location
-        sql = """SELECT h.screenshot_path FROM history h
-                 JOIN objects o ON h.object_fk = o.id
-                 WHERE o.location_fk = ?"""
-        paths = self.query(sql, (loc_pk,)).fetchall()
-        for path_tuple in paths:
-            try:
-                if path_tuple[0] and os.path.exists(path_tuple[0]):
-                    os.remove(path_tuple[0])
-            except Exception as e:
-                print(f"Error deleting screenshot file: {e}")
-
-        # Now delete the location. The CASCADE constraint will handle deleting
-        # associated objects and their history records from the DB.
+        # The CASCADE constraint will handle deleting associated objects and their history
+        # records; screenshots left unreferenced are tombstoned for the background reaper.
         self.query("DELETE FROM locations WHERE id=?", (loc_pk,)); self.commit()
+        self._unindex_location(loc_pk)
 
     def get_location_pk_by_name(self, sietch_name, location_id):
-        row = self.query("SELECT id FROM locations WHERE sietch_name=? AND location_id=?", (sietch_name, location_id)).fetchone()
-        return row[0] if row else None
+        return self._location_pks.get((sietch_name, location_id))
 
     def get_object_pk_by_name(self, sietch_name, location_id, object_id):
-        loc_pk = self.get_location_pk_by_name(sietch_name, location_id)
+        loc_pk = self._location_pks.get((sietch_name, location_id))
         if not loc_pk: return None
-        row = self.query("SELECT id FROM objects WHERE location_fk=? AND object_id=?", (loc_pk, object_id)).fetchone()
-        return row[0] if row else None
+        return self._object_pks[loc_pk].get(object_id)
+
+    def get_object_key(self, obj_pk):
+        """Returns (sietch_name, location_id, object_id) for an object primary key, or None."""
+        key = self._object_keys.get(obj_pk)
+        if not key: return None
+        return self._location_keys[key[0]] + (key[1],)
 
     def rename_object(self, obj_pk, new_id):
         try:
             self.query("UPDATE objects SET object_id=? WHERE id=?", (new_id, obj_pk)); self.commit()
-            return True, "Success"
         except sqlite3.IntegrityError:
             return False, "An object with this ID already exists at this location."
+        loc_pk, _ = self._object_keys[obj_pk]
+        self._unindex_object(obj_pk)
+        self._index_object(obj_pk, loc_pk, new_id)
+        return True, "Success"
 
     def delete_object(self, obj_pk):
-        # Get screenshot paths for this specific object
-        paths = self.query("SELECT screenshot_path FROM history WHERE object_fk=?", (obj_pk,)).fetchall()
-        for path_tuple in paths:
-            try:
-                if path_tuple[0] and os.path.exists(path_tuple[0]):
-                    os.remove(path_tuple[0])
-            except Exception as e:
-                print(f"Error deleting screenshot file: {e}")
-        # Now delete the object, history will be cascaded.
+        # History will be cascaded; screenshots left unreferenced are tombstoned for the background reaper.
         self.query("DELETE FROM objects WHERE id=?", (obj_pk,)); self.commit()
+        self._unindex_object(obj_pk)
 
-    def save_data_point(self, data, image_folder):
+    def find_near_duplicate(self, data):
+        """Returns the saved point closest in time that is a near-duplicate of `data`, as {'id', 'timestamp', 'health'}, or None."""
+        obj_pk = self.get_object_pk_by_name(data["sietch"], data["location_id"], data["object_id"])
+        if not obj_pk or isinstance(data["health"], str): return None
+        ts, health_cp = int(data["timestamp"].timestamp()), self._encode_health(data["health"])
+        phash = ImageStore.perceptual_hash(data["roi_image"])
+        window = self.NEAR_DUPLICATE_WINDOW_S
+        best = None
+        for history_id, timestamp, other_cp, other_hash in self.query(
+                "SELECT id, timestamp, health_cp, phash FROM history WHERE object_fk = ? AND timestamp BETWEEN ? AND ? AND phash IS NOT NULL",
+                (obj_pk, ts - window, ts + window)).fetchall():
+            if abs(other_cp - health_cp) > self.NEAR_DUPLICATE_HEALTH_CP: continue
+            if ImageStore.hash_distance(phash, other_hash) > self.NEAR_DUPLICATE_HASH_BITS: continue
+            if best is None or abs(timestamp - ts) < abs(best[1] - ts): best = (history_id, timestamp, other_cp)
+        if best is None: return None
+        return {"id": best[0], "timestamp": datetime.fromtimestamp(best[1]), "health": best[2] / self.HEALTH_SCALE}
+
+    def fill_perceptual_hashes(self, batch_size=256):
+        hashes = {}
+        def fill(history_id, image_ref):
+            if image_ref not in hashes:
+                image = self.read_image(image_ref)
+                hashes[image_ref] = ImageStore.perceptual_hash(image) if image is not None else None
+            if hashes[image_ref] is not None:
+                self.query("UPDATE history SET phash = ? WHERE id = ?", (hashes[image_ref], history_id))
+        return self._fill_batch("perceptual_hashes", """SELECT id, image_ref FROM history WHERE phash IS NULL AND image_ref IS NOT NULL
+                                                         AND image_pending = 0 AND id > ? ORDER BY id LIMIT ?""", batch_size, fill)
+
+    def save_data_point(self, data, image_writer=None, skip_near_duplicates=False):
+        """Saves a captured data point; with an `image_writer` the crop is written in the background, see mark_image_written."""
+        if not self.image_pack: return False, "No image folder to save the screenshot in."
         try:
-            loc_fk_row = self.query("SELECT id FROM locations WHERE sietch_name=? AND location_id=?", (data["sietch"], data["location_id"])).fetchone()
-            if not loc_fk_row: return False, f"Location '{data['location_id']}' not found."
-            loc_fk = loc_fk_row[0]
-            self.query("INSERT OR IGNORE INTO objects (location_fk, object_id) VALUES (?, ?)", (loc_fk, data["object_id"]))
-            obj_fk = self.query("SELECT id FROM objects WHERE location_fk=? AND object_id=?", (loc_fk, data["object_id"])).fetchone()[0]
-            ts = data["timestamp"]; filename = f"capture_{ts.strftime('%Y%m%d_%H%M%S')}.png"; path = os.path.join(image_folder, filename)
-            cv2.imwrite(path, data["roi_image"])
-            self.query("INSERT INTO history (object_fk, timestamp, health_percent, screenshot_path) VALUES (?, ?, ?, ?)", (obj_fk, int(ts.timestamp()), data["health"], path)); self.commit()
+            if skip_near_duplicates and self.find_near_duplicate(data):
+                return False, "A near-duplicate of this capture is already saved."
+            loc_fk = self.get_location_pk_by_name(data["sietch"], data["location_id"])
+            if not loc_fk: return False, f"Location '{data['location_id']}' not found."
+            obj_fk = self._object_pks[loc_fk].get(data["object_id"])
+            new_object = obj_fk is None
+            if new_object:
+                obj_fk = self.query("INSERT INTO objects (location_fk, object_id) VALUES (?, ?)", (loc_fk, data["object_id"])).lastrowid
+            ts = data["timestamp"]
+            image_ref = ImageStore.content_ref(data["roi_image"])
+            # An identical crop still with the writer pool is as good as stored; this row waits on that write.
+            in_flight = self.is_image_pending(image_ref)
+            needs_write = not in_flight and not self._is_image_stored(image_ref)
+            history_id = self.query("SELECT COALESCE(MAX(id), 0) + 1 FROM history").fetchone()[0]
+            self.query("INSERT INTO history (object_fk, timestamp, id, health_cp, image_ref, image_pending, crop_slot, phash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (obj_fk, int(ts.timestamp()), history_id, self._encode_health(data["health"]), image_ref,
+                        int(in_flight or (needs_write and image_writer is not None)), self._put_raw_crop(data["roi_image"]),
+                        ImageStore.perceptual_hash(data["roi_image"])))
+            if needs_write and not image_writer:
+                self._set_pack_location(image_ref, self.image_pack.append(self.crop_codec.encode(data["roi_image"])))
+            self._store_thumbnail(image_ref, data["roi_image"])
+            self.commit()
+            if new_object: self._index_object(obj_fk, loc_fk, data["object_id"])
+            if needs_write and image_writer:
+                image_writer.submit(history_id, data["roi_image"])
             return True, "Success"
-        except Exception as e: return False, str(e)
+        except Exception as e:
+            self.conn.rollback()
+            return False, str(e)
+
+    def mark_image_written(self, history_id, error=None, location=None):
+        """Validates the pending screenshot reference a write was for, or drops it if the write failed; returns the reference."""
+        # Rows saved with the same crop while it was being written wait on this write too.
+        row = self.query("SELECT image_ref FROM history WHERE id = ?", (history_id,)).fetchone()
+        waiting = "image_pending = 1 AND (id = ? OR image_ref = ?)"
+        params = (history_id, row[0] if row else None)
+        if error:
+            self.query(f"UPDATE history SET image_ref = NULL, image_pending = 0 WHERE {waiting}", params)
+        else:
+            if isinstance(location, tuple) and row and row[0]: self._set_pack_location(row[0], location)
+            self.query(f"UPDATE history SET image_pending = 0 WHERE {waiting}", params)
+        self.commit()
+        return params[1]
+
+    def recover_pending_images(self):
+        """Keeps screenshots left pending by a crash that reached disk and drops the rest; returns how many were dropped."""
+        dropped = 0
+        for history_id, image_ref in self.query("SELECT MIN(id), image_ref FROM history WHERE image_pending = 1 GROUP BY image_ref").fetchall():
+            exists = self._is_image_stored(image_ref)
+            self.mark_image_written(history_id, None if exists else "missing")
+            dropped += not exists
+        return dropped
 
     def get_all_objects_with_sietch_and_location(self):
         sql = """
@@ -142,35 +908,162 @@ class DatabaseManager:
         return self.query(sql).fetchall()
 
     def get_history_for_object(self, sietch, location, object_id):
-        sql = """
-            SELECT h.id, h.timestamp, h.health_percent, h.screenshot_path
-            FROM history h
-            JOIN objects o ON h.object_fk = o.id
-            JOIN locations l ON o.location_fk = l.id
-            WHERE l.sietch_name = ? AND l.location_id = ? AND o.object_id = ?
-            ORDER BY h.timestamp ASC
-        """
+        obj_pk = self.get_object_pk_by_name(sietch, location, object_id)
+        if not obj_pk: return []
+        # Thumbnails come with the rows, so the history panel needs no image reads of its own.
+        sql = """SELECT h.id, h.timestamp, h.health_cp, CASE WHEN h.image_pending THEN NULL ELSE h.image_ref END, t.data
+                 FROM history h LEFT JOIN thumbnails t ON t.ref = h.image_ref
+                 WHERE h.object_fk = ? ORDER BY h.timestamp, h.id"""
         history_data = []
-        for row in self.query(sql, (sietch, location, object_id)).fetchall():
+        for row in self.query(sql, (obj_pk,)).fetchall():
             history_data.append({
                 "id": row[0],
                 "timestamp": datetime.fromtimestamp(row[1]),
-                "health": float(row[2]),
-                "image_path": row[3]
+                "health": row[2] / self.HEALTH_SCALE,
+                "image_ref": row[3],
+                "thumbnail": row[4]
             })
         return history_data
 
+    def get_history_arrays(self, obj_pk, start=None, end=None, max_points=None):
+        """Reads an object's history as id, timestamp and health arrays, thinned to about `max_points` keeping the first and last two."""
+        where, params = "object_fk = ?", [obj_pk]
+        if start is not None: where += " AND timestamp >= ?"; params.append(int(start))
+        if end is not None: where += " AND timestamp <= ?"; params.append(int(end))
+
+        count = self.query(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+        if max_points and count > max_points:
+            stride = -(-count // max_points)
+            sql = f"""
+                SELECT id, timestamp, health_cp FROM (
+                    SELECT id, timestamp, health_cp, ROW_NUMBER() OVER (ORDER BY timestamp, id) AS rn
+                    FROM history WHERE {where}
+                ) WHERE (rn - 1) % ? = 0 OR rn >= ?
+                ORDER BY timestamp, id
+            """
+            cursor = self.query(sql, params + [stride, count - 1])
+        else:
+            cursor = self.query(f"SELECT id, timestamp, health_cp FROM history WHERE {where} ORDER BY timestamp, id", params)
+
+        rows = np.fromiter(cursor, dtype=[("id", np.int64), ("timestamp", np.int64), ("health_cp", np.int32)], count=-1)
+        return {
+            "id": rows["id"].copy(),
+            "timestamp": rows["timestamp"].copy(),
+            "health": rows["health_cp"] / self.HEALTH_SCALE
+        }
+
+    def _select_objects(self, obj_pks):
+        """Returns a function turning a column name into a WHERE condition limiting a read to `obj_pks`."""
+        if obj_pks is None: return lambda column: "1"
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected_objects (id INTEGER PRIMARY KEY)")
+        self.conn.execute("DELETE FROM selected_objects")
+        self.conn.executemany("INSERT OR IGNORE INTO selected_objects (id) VALUES (?)", ((int(pk),) for pk in obj_pks)); self.commit()
+        return lambda column: f"{column} IN (SELECT id FROM temp.selected_objects)"
+
+    def get_all_history_arrays(self, obj_pks=None):
+        """Reads the history of every object, or those in `obj_pks`, as object_pk, timestamp and health arrays."""
+        selected = self._select_objects(obj_pks)
+        cursor = self.query(f"SELECT object_fk, timestamp, health_cp FROM history WHERE {selected('object_fk')} ORDER BY object_fk, timestamp, id")
+        rows = np.fromiter(cursor, dtype=[("object_pk", np.int64), ("timestamp", np.int64), ("health_cp", np.int32)], count=-1)
+        return {
+            "object_pk": rows["object_pk"].copy(),
+            "timestamp": rows["timestamp"].copy(),
+            "health": rows["health_cp"] / self.HEALTH_SCALE
+        }
+
+    def get_decay_sums(self, obj_pks=None):
+        """Reads the object_decay least-squares sums, with each object's last timestamp, as arrays."""
+        selected = self._select_objects(obj_pks)
+        sql = f"""SELECT d.object_fk, d.origin_ts, (SELECT MAX(timestamp) FROM history WHERE object_fk = d.object_fk),
+                         d.n, d.sum_t, d.sum_h, d.sum_tt, d.sum_th
+                  FROM object_decay d WHERE {selected('d.object_fk')}"""
+        columns = [("object_pk", np.int64), ("origin_ts", np.int64), ("last_ts", np.int64), ("n", np.int64),
+                   ("sum_t", np.float64), ("sum_h", np.float64), ("sum_tt", np.float64), ("sum_th", np.float64)]
+        rows = np.fromiter(self.query(sql), dtype=columns, count=-1)
+        return {name: rows[name].copy() for name, _ in columns}
+
+    def get_projection_inputs(self, obj_pks=None):
+        """Reads the first, one-before-last and last point of every object with at least two, as arrays."""
+        def point(column, order, offset=0):
+            return f"(SELECT {column} FROM history WHERE object_fk = o.id ORDER BY timestamp {order}, id {order} LIMIT 1 OFFSET {offset})"
+        selected = self._select_objects(obj_pks)
+        sql = f"""
+            SELECT * FROM (
+                SELECT o.id, {point('timestamp', 'ASC')}, {point('health_cp', 'ASC')},
+                       {point('timestamp', 'DESC', 1)} AS prev_ts, {point('health_cp', 'DESC', 1)},
+                       {point('timestamp', 'DESC')}, {point('health_cp', 'DESC')}
+                FROM objects o
+                JOIN locations l ON o.location_fk = l.id
+                WHERE {selected('o.id')}
+                ORDER BY l.sietch_name, l.location_id, o.object_id
+            ) WHERE prev_ts IS NOT NULL
+        """
+        columns = [("object_pk", np.int64), ("first_ts", np.int64), ("first_cp", np.int32), ("prev_ts", np.int64),
+                   ("prev_cp", np.int32), ("last_ts", np.int64), ("last_cp", np.int32)]
+        rows = np.fromiter(self.query(sql), dtype=columns, count=-1)
+        inputs = {name: rows[name].copy() for name in ("object_pk", "first_ts", "prev_ts", "last_ts")}
+        for name in ("first", "prev", "last"):
+            # float64, as the health was stored before it became an integer, so projections match it exactly.
+            inputs[f"{name}_health"] = rows[f"{name}_cp"] / self.HEALTH_SCALE
+        return inputs
+
+    def get_object_rollup(self, obj_pk, start=None, end=None):
+        return self._read_rollup("object_hourly", "object_fk", obj_pk, start, end)
+
+    def get_location_rollup(self, loc_pk, start=None, end=None):
+        return self._read_rollup("location_hourly", "location_fk", loc_pk, start, end)
+
+    def _read_rollup(self, table, key_column, key, start, end):
+        """Reads hourly buckets as bucket_start, min, max, last (float32 health) and count arrays."""
+        bucket = self.ROLLUP_BUCKET_S
+        where, params = f"{key_column} = ?", [key]
+        if start is not None: where += " AND hour >= ?"; params.append(int(start) // bucket)
+        if end is not None: where += " AND hour <= ?"; params.append(int(end) // bucket)
+        cursor = self.query(f"SELECT hour, min_cp, max_cp, last_cp, n FROM {table} WHERE {where} ORDER BY hour", params)
+        rows = np.fromiter(cursor, dtype=[("hour", np.int64), ("min", np.int32), ("max", np.int32), ("last", np.int32), ("count", np.int32)], count=-1)
+        scale = np.float32(self.HEALTH_SCALE)
+        return {
+            "bucket_start": rows["hour"] * bucket,
+            "min": rows["min"].astype(np.float32) / scale,
+            "max": rows["max"].astype(np.float32) / scale,
+            "last": rows["last"].astype(np.float32) / scale,
+            "count": rows["count"].copy()
+        }
+
     def delete_history_point(self, history_id):
-        path_tuple = self.query("SELECT screenshot_path FROM history WHERE id=?", (history_id,)).fetchone()
-        if path_tuple and path_tuple[0] and os.path.exists(path_tuple[0]):
-            try:
-                os.remove(path_tuple[0])
-            except Exception as e:
-                print(f"Error deleting screenshot file: {e}")
         self.query("DELETE FROM history WHERE id = ?", (history_id,)); self.commit()
 
+    def get_history_health(self, history_id):
+        row = self.query("SELECT health_cp FROM history WHERE id = ?", (history_id,)).fetchone()
+        return row[0] / self.HEALTH_SCALE if row else None
+
     def update_history_health(self, history_id, new_health):
-        self.query("UPDATE history SET health_percent = ? WHERE id = ?", (new_health, history_id)); self.commit()
+        self.query("UPDATE history SET health_cp = ? WHERE id = ?", (self._encode_health(new_health), history_id)); self.commit()
+
+    def freelist_count(self):
+        return self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def incremental_vacuum(self, max_pages):
+        """Returns freed pages to the filesystem, at most `max_pages` of them; returns how many were reclaimed."""
+        self.commit()
+        before = self.freelist_count()
+        # executescript steps the pragma to completion; a plain execute frees only a single page.
+        self.conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        return before - self.freelist_count()
+
+    def get_table_names(self):
+        return [r[0] for r in self.query("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall()]
+
+    def analyze_table(self, table, analysis_limit=1000):
+        """Refreshes planner statistics for one table, sampling at most roughly `analysis_limit` rows per index."""
+        self.conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+        self.conn.execute(f'ANALYZE "{table}"'); self.commit()
+
+    def optimize(self):
+        self.conn.execute("PRAGMA optimize"); self.commit()
 
     def close(self):
+        if self.image_pack: self.image_pack.close()
+        if self.archive_pack: self.archive_pack.close()
+        if self.crop_array: self.crop_array.flush()
         if self.conn: self.conn.close()
\ No newline at end of file
@@ -0,0 +1,48 @@
+import os
+import queue
+import threading
+
+class FileReaper:
+    """
+    Unlinks screenshot files of deleted data points on a background thread.
+
+    The database records which files are no longer referenced (file tombstones); the Tk
+    thread hands them over a batch at a time with `start()` and, once `poll()` reports them
+    done, clears their tombstones. A batch cut short by a shutdown is simply handed over
+    again on the next start, since unlinking a file that is already gone counts as done.
+    """
+    def __init__(self):
+        self._thread = None
+        self._results = queue.Queue()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, batch):
+        """Starts unlinking a list of (image_ref, path) pairs. Returns False if a batch is still running."""
+        if self.is_running(): return False
+        self._thread = threading.Thread(target=self._run, args=(batch,), daemon=True)
+        self._thread.start()
+        return True
+
+    def poll(self):
+        """Returns the (image_ref, error) results completed since the last call; error is None on success."""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def join(self):
+        if self._thread is not None: self._thread.join()
+
+    def _run(self, batch):
+        for image_ref, path in batch:
+            try:
+                if path: os.remove(path)
+                self._results.put((image_ref, None))
+            except FileNotFoundError:
+                self._results.put((image_ref, None))
+            except OSError as e:
+                self._results.put((image_ref, e))
@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import ttk, simpledialog, messagebox
+from tkinter import ttk, simpledialog, messagebox, filedialog
 from PIL import Image, ImageTk
 import os
 
@@ -49,6 +49,10 @@ class SietchManagerWindow(tk.Toplevel):
         # Delete Sietch
         ttk.Button(action_frame, text="Delete Selected", command=self.delete_sietch).pack(fill='x', pady=5)
 
+        # Shard files: one sietch per standalone database file
+        ttk.Button(action_frame, text="Archive Selected to File...", command=self.archive_sietch).pack(fill='x', pady=(20, 5))
+        ttk.Button(action_frame, text="Restore from File...", command=self.restore_sietch).pack(fill='x', pady=5)
+
     def populate_list(self):
         self.sietch_listbox.delete(0, tk.END)
         sietches = self.app.db.get_sietches()
@@ -90,6 +94,30 @@ class SietchManagerWindow(tk.Toplevel):
             self.populate_list()
             self.app.refresh_all_ui()
 
+    def archive_sietch(self):
+        selected_index = self.sietch_listbox.curselection()
+        if not selected_index: return
+        name = self.sietch_listbox.get(selected_index)
+
+        path = filedialog.asksaveasfilename(parent=self, title=f"Archive '{name}'", defaultextension=".db", initialfile=f"sietch_{name}.db", filetypes=[("Sietch Database", "*.db")])
+        if not path: return
+        success, msg = self.app.db.archive_sietch(name, path)
+        if success:
+            self.populate_list()
+            self.app.refresh_all_ui()
+        else:
+            messagebox.showerror("Error", msg, parent=self)
+
+    def restore_sietch(self):
+        path = filedialog.askopenfilename(parent=self, title="Restore Sietch", filetypes=[("Sietch Database", "*.db")])
+        if not path: return
+        success, msg = self.app.db.import_sietch_shard(path)
+        if success:
+            self.populate_list()
+            self.app.refresh_all_ui()
+        else:
+            messagebox.showerror("Error", msg, parent=self)
+
 class MapFrame(ttk.Frame):
     def __init__(self, parent, app):
         super().__init__(parent)
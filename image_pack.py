@@ -0,0 +1,86 @@
+import os
+import mmap
+import threading
+
+class ImagePack:
+    """
+    Append-only segment files holding encoded capture crops.
+
+    Crops are appended back to back to the active segment until it reaches SEGMENT_MAX_BYTES,
+    then a new segment is started. The pack itself has no index: callers keep each crop's
+    (segment, offset, length) and read it back as a slice of the memory-mapped segment, so
+    a history panel costs a few slices instead of a file open per crop. Deleted crops leave
+    dead bytes behind until their segment is compacted by copying the live ones forward.
+    """
+    SEGMENT_PREFIX = "segment_"
+    SEGMENT_SUFFIX = ".pack"
+    SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._unsynced = set()
+        segments = self.list_segments()
+        self.active_segment = segments[-1] if segments else 1
+
+    def segment_path(self, segment):
+        return os.path.join(self.root, f"{self.SEGMENT_PREFIX}{segment:06d}{self.SEGMENT_SUFFIX}")
+
+    def list_segments(self):
+        if not os.path.isdir(self.root): return []
+        names = (n for n in os.listdir(self.root) if n.startswith(self.SEGMENT_PREFIX) and n.endswith(self.SEGMENT_SUFFIX))
+        return sorted(int(n[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]) for n in names)
+
+    def segment_size(self, segment):
+        path = self.segment_path(segment)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def append(self, data, sync=True):
+        """
+        Appends encoded bytes and returns their (segment, offset, length). Safe to call from
+        any thread. With sync=False the caller must call sync() before publishing the location.
+        """
+        with self._lock:
+            size = self.segment_size(self.active_segment)
+            if size and size + len(data) > self.SEGMENT_MAX_BYTES:
+                self.active_segment += 1; size = 0
+            os.makedirs(self.root, exist_ok=True)
+            # A torn append only leaves unreferenced bytes at the end of the segment.
+            with open(self.segment_path(self.active_segment), "ab") as f:
+                f.write(data)
+                f.flush()
+                if sync: os.fsync(f.fileno())
+                else: self._unsynced.add(self.active_segment)
+            return self.active_segment, size, len(data)
+
+    def sync(self):
+        """Makes every append done with sync=False durable."""
+        with self._lock:
+            for segment in self._unsynced:
+                with open(self.segment_path(segment), "rb+") as f:
+                    os.fsync(f.fileno())
+            self._unsynced.clear()
+
+    def read(self, segment, offset, length):
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < offset + length:
+                # The segment grew since it was mapped; map it again at its current size.
+                if mapped is not None: mapped.close()
+                with open(self.segment_path(segment), "rb") as f:
+                    mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapped[offset:offset + length]
+
+    def remove_segment(self, segment):
+        with self._lock:
+            mapped = self._maps.pop(segment, None)
+            if mapped is not None: mapped.close()
+            self._unsynced.discard(segment)
+            path = self.segment_path(segment)
+            if os.path.exists(path): os.remove(path)
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values(): mapped.close()
+            self._maps.clear()
@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class ImageScanner:
+    """
+    Integrity check of the screenshot folders against the database.
+
+    Directories are listed with `os.scandir` and the files found are stat'ed in chunks, both
+    on a pool of worker threads, and compared in memory with the set of referenced paths
+    the caller read from the database in one query. The scan reports:
+    - orphans: image files no data point references, excluding files modified within
+      ORPHAN_GRACE_S so a screenshot that is still being written is never reported;
+    - dangling: image references whose file no longer exists.
+    The scanner only reads the filesystem; fixing either kind is left to the caller.
+    """
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+    STAT_CHUNK = 256
+    ORPHAN_GRACE_S = 300
+
+    def __init__(self, roots, workers=8):
+        roots = sorted({self._key(root) for root in roots})
+        # A folder inside another one is covered by the outer scan.
+        self.roots = []
+        for root in roots:
+            if not self._is_under_roots(root): self.roots.append(root)
+        self.workers = workers
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, referenced, ignored=(), progress_callback=None, done_callback=None):
+        """
+        Starts a scan in a background thread. Returns False if one is already running.
+
+        Both callbacks are invoked from the worker thread:
+        - progress_callback(files_scanned)
+        - done_callback(report, error), where exactly one of the two is None.
+        """
+        if self.is_running(): return False
+        def run():
+            try:
+                report = self.scan(referenced, ignored, progress_callback)
+            except Exception as e:
+                if done_callback: done_callback(None, e)
+                return
+            if done_callback: done_callback(report, None)
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return True
+
+    def scan(self, referenced, ignored=(), progress_callback=None):
+        """
+        Scans the roots in the calling thread.
+
+        Args:
+            referenced: Dict of file path -> image reference for every screenshot stored as a file.
+            ignored: Paths that are neither orphans nor checked, such as files already queued for deletion.
+
+        Returns:
+            A dict with 'files_scanned', 'orphans' (paths), 'orphan_bytes' and 'dangling' (image references).
+        """
+        started = time.time()
+        referenced = {self._key(path): ref for path, ref in referenced.items()}
+        ignored = {self._key(path) for path in ignored}
+        seen, orphans = set(), []
+        files_scanned = orphan_bytes = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-scanner") as pool:
+            pending = {pool.submit(self._list_dir, root) for root in self.roots if os.path.isdir(root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, result = future.result()
+                    if kind == "dir":
+                        paths, subdirs = result
+                        pending |= {pool.submit(self._list_dir, subdir) for subdir in subdirs}
+                        pending |= {pool.submit(self._stat_files, paths[i:i + self.STAT_CHUNK]) for i in range(0, len(paths), self.STAT_CHUNK)}
+                        continue
+                    for path, size, mtime in result:
+                        files_scanned += 1
+                        key = self._key(path)
+                        seen.add(key)
+                        if key in referenced or key in ignored or mtime > started - self.ORPHAN_GRACE_S: continue
+                        orphans.append(path); orphan_bytes += size
+                    if progress_callback: progress_callback(files_scanned)
+            # References outside the scanned folders were not listed, so check them one by one.
+            missing = [key for key in referenced if key not in seen and key not in ignored]
+            outside = [key for key in missing if not self._is_under_roots(key)]
+            exists = dict(zip(outside, pool.map(os.path.exists, outside)))
+        dangling = sorted(referenced[key] for key in missing if not exists.get(key, False))
+        return {"files_scanned": files_scanned, "orphans": sorted(orphans), "orphan_bytes": orphan_bytes, "dangling": dangling}
+
+    def _list_dir(self, path):
+        paths, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False): subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(self.IMAGE_EXTENSIONS): paths.append(entry.path)
+        except OSError as e:
+            print(f"Image scan: cannot list {path}: {e}")
+        return "dir", (paths, subdirs)
+
+    def _stat_files(self, paths):
+        entries = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return "stat", entries
+
+    def _is_under_roots(self, key):
+        return any(key == root or key.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots)
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
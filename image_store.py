@@ -0,0 +1,72 @@
+import os
+import re
+import hashlib
+import numpy as np
+import cv2
+
+class ImageStore:
+    """
+    Content-addressed store for capture crops.
+
+    A crop is named by a hash of its pixels, so identical crops are stored once and two saves
+    in the same second can no longer overwrite each other. Files are sharded into two levels
+    of subdirectories by the leading hex digits of the hash to keep every directory small.
+    The store only knows about files; reference counting lives in the database.
+    """
+    EXTENSION = ".png"
+    _REF_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+    def __init__(self, root):
+        self.root = root
+
+    @staticmethod
+    def content_ref(image):
+        """Returns the reference for a crop: a 128-bit hash of its shape, dtype and pixels."""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.shape}{image.dtype}".encode())
+        digest.update(image.data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def perceptual_hash(image):
+        """
+        Returns a 64-bit DCT hash of a crop as a signed integer (SQLite's INTEGER range).
+        Crops that look alike differ in few bits even when their pixels are not identical.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].flatten()
+        # The DC term only carries overall brightness, so it is left out of the median.
+        value = int.from_bytes(np.packbits(low > np.median(low[1:])).tobytes(), "big")
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    @staticmethod
+    def hash_distance(a, b):
+        """Hamming distance between two perceptual hashes."""
+        return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+    @classmethod
+    def is_content_ref(cls, ref):
+        return bool(ref) and cls._REF_PATTERN.match(ref) is not None
+
+    def path_for(self, ref):
+        return os.path.join(self.root, ref[:2], ref[2:4], ref + self.EXTENSION)
+
+    def contains(self, ref):
+        # Files only ever appear under their final name once fully written.
+        return os.path.exists(self.path_for(ref))
+
+    def put(self, image):
+        """Stores a crop synchronously and returns its reference."""
+        ref = self.content_ref(image)
+        path = self.path_for(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ok, encoded = cv2.imencode(self.EXTENSION, image)
+            if not ok: raise IOError(f"Could not encode {os.path.basename(path)}")
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(temp_path, path)
+        return ref
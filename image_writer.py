@@ -0,0 +1,65 @@
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from crop_codec import CropCodec
+
+class ImageWriterPool:
+    """
+    Encodes and writes capture crops on background threads.
+
+    Each job encodes the crop and either appends it to an ImagePack, using the pool's
+    CropCodec, or writes it in the format of its file extension to a
+    temporary file, fsyncs it and renames it into place, so a finished job means the image
+    is durable. Results are collected in a queue for the Tk thread to pick up with `poll()`;
+    the database is only ever touched there.
+    """
+    def __init__(self, workers=2, pack=None, codec=None):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-writer")
+        self._results = queue.Queue()
+        self.pack = pack
+        self.codec = codec or CropCodec()
+
+    def submit(self, history_id, image, path=None):
+        """Queues a crop for `path`, or for the pack when no path is given."""
+        self._executor.submit(self._append if path is None else self._write, history_id, image, path)
+
+    def poll(self):
+        """
+        Returns the (history_id, location, error) results completed since the last call; error
+        is None on success. The location is the file path, or (segment, offset, length) in the pack.
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def shutdown(self):
+        """Waits for every queued write to finish."""
+        self._executor.shutdown(wait=True)
+
+    def _append(self, history_id, image, _path):
+        try:
+            self._results.put((history_id, self.pack.append(self.codec.encode(image)), None))
+        except Exception as e:
+            self._results.put((history_id, None, e))
+
+    def _write(self, history_id, image, path):
+        # Identical crops share a path, so concurrent jobs need their own temporary files.
+        temp_path = f"{path}.{history_id}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ok, encoded = cv2.imencode(os.path.splitext(path)[1], image)
+            if not ok: raise IOError(f"Could not encode {os.path.basename(path)}")
+            with open(temp_path, "wb") as f:
+                f.write(encoded.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+            self._results.put((history_id, path, None))
+        except Exception as e:
+            if os.path.exists(temp_path): os.remove(temp_path)
+            self._results.put((history_id, path, e))
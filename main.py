@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from PIL import Image, ImageTk
+import io
 import os
 import queue
 import shutil
@@ -18,11 +19,31 @@ import matplotlib.dates as mdates
 from database import DatabaseManager
 from gui_components import ScrollableFrame, MapFrame, SietchManagerWindow
 from analyzer import HealthAnalyzer
+from backup import DatabaseBackup
+from maintenance import DatabaseMaintenance
+from retention import RetentionPolicy
+from capture_journal import CaptureJournal
+from image_writer import ImageWriterPool
+from image_store import ImageStore
+from file_reaper import FileReaper
+from image_scanner import ImageScanner
+from projection import ProjectionEngine, ProjectionCache, PriorityWatch
 
 class VultureTrackerApp:
     AVG_STORM_CYCLE_HOURS = 0.875
     MIN_STORM_INTERVAL_H = 0.75
     MAX_STORM_INTERVAL_H = 1.0
+    GRAPH_MAX_POINTS = 500
+    BACKUP_INTERVAL_H = 24
+    BACKUP_RETENTION = 7
+    MAINTENANCE_INTERVAL_MS = 30 * 60 * 1000
+    MAINTENANCE_RETRY_MS = 60 * 1000
+    MAINTENANCE_SLICE_GAP_MS = 50
+    REAP_BATCH = 200
+    REAP_POLL_MS = 250
+    WATCH_LIST_SIZE = 10
+    WATCH_MIN_DELAY_MS = 1000
+    WATCH_MAX_DELAY_MS = 60 * 60 * 1000
 
     def __init__(self, root):
         self.root = root
@@ -34,20 +55,49 @@ class VultureTrackerApp:
         self.image_folder = os.path.join(script_dir, "vulture_tracker_images_v3")
         os.makedirs(self.image_folder, exist_ok=True)
         db_path = os.path.join(script_dir, "vulture_tracker_v3.db")
-        self.db = DatabaseManager(db_path)
+        self.db = DatabaseManager(db_path, self.image_folder)
+        retention = int(self.db.get_config("backup_retention") or self.BACKUP_RETENTION)
+        self.backup = DatabaseBackup(db_path, os.path.join(script_dir, "backups"), retention)
+        self.maintenance = DatabaseMaintenance(self.db, RetentionPolicy.from_config(self.db))
+        self.journal = CaptureJournal(os.path.join(script_dir, "capture_journal.bin"))
+        # Journal entries of saved captures whose crop is still with the writer pool, by image reference.
+        self.journal_waiting = {}
+        self.image_writer = ImageWriterPool(pack=self.db.image_pack, codec=self.db.crop_codec)
+        self.file_reaper = FileReaper()
+        # Version 2 kept its screenshots in a flat folder next to the script; it is checked too.
+        self.image_scanner = ImageScanner([self.image_folder, os.path.join(script_dir, "vulture_tracker_images")])
+        self.projection_engine = ProjectionEngine(self.AVG_STORM_CYCLE_HOURS, self.MIN_STORM_INTERVAL_H, self.MAX_STORM_INTERVAL_H)
+        # "endpoints" projects from the first and last two points; "robust" fits every point;
+        # "online" fits every point from running sums the database keeps per object.
+        self.decay_fit = self.db.get_config("decay_fit") or "endpoints"
+        self.projection_cache = ProjectionCache(self._load_projection_inputs, self._project_rows, self._damage_spread)
+        self.priority_watch = PriorityWatch(self.WATCH_LIST_SIZE)
+        self.watch_timer = None
+        dropped = self.db.recover_pending_images()
+        if dropped: print(f"{dropped} screenshot(s) were not written before the last shutdown.")
 
         self.photo_references = {}
         self.last_capture_data = None
         self.capture_queue = queue.Queue()
+        self.backup_queue = queue.Queue()
+        self.scan_queue = queue.Queue()
         self.graph_canvas = None
+        # Position in the database change log; None until the first full refresh.
+        self.change_seq = None
 
         self.setup_styles()
         self.create_widgets()
         self.root.after(100, self.refresh_all_ui)
+        self._restore_unsaved_capture()
 
         self.root.bind_all("<Control-Shift-h>", self._trigger_capture)
 
         self.check_capture_queue()
+        self.check_backup_queue()
+        self.check_image_writer()
+        self.check_file_reaper()
+        self.root.after(5000, self._auto_backup)
+        self.root.after(self.MAINTENANCE_RETRY_MS, self._run_maintenance_slice)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         print("Vulture Tracker UI is running. Press Ctrl+Shift+H in-game to capture.")
 
@@ -96,6 +146,8 @@ class VultureTrackerApp:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Set Main Map Image...", command=self.set_main_map_image)
         file_menu.add_command(label="Manage Sietches...", command=self.open_sietch_manager)
+        file_menu.add_command(label="Back Up Database Now", command=self.backup_database)
+        file_menu.add_command(label="Check Screenshot Files...", command=self.check_image_files)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.on_closing)
 
@@ -143,6 +195,9 @@ class VultureTrackerApp:
         self.save_button = ttk.Button(form_frame, text="Save Captured Data", command=self.save_captured_data, state="disabled")
         self.save_button.grid(row=5, columnspan=2, sticky='ew', pady=5, padx=5)
 
+        self.status_label = ttk.Label(form_frame, text="", font=('Arial', 9))
+        self.status_label.grid(row=6, columnspan=2, sticky='w', padx=5)
+
         # --- Right Column Grid Configuration ---
         right_column_frame.grid_rowconfigure(0, weight=1) # Top half for lists
         right_column_frame.grid_rowconfigure(1, weight=1) # Bottom half for graph/history
@@ -166,9 +221,9 @@ class VultureTrackerApp:
         priority_tree_frame = ttk.Frame(top_right_frame)
         priority_tree_frame.grid(row=1, column=0, sticky='nsew', padx=5)
         priority_tree_frame.column_configure(0, weight=1)
-        self.priority_tree = ttk.Treeview(priority_tree_frame, columns=("Time to Failure", "Object"), show="headings", height=5)
-        self.priority_tree.heading("Time to Failure", text="Time to Failure"); self.priority_tree.heading("Object", text="Object")
-        self.priority_tree.column("Time to Failure", width=120, anchor='w'); self.priority_tree.column("Object", width=280, anchor='w')
+        self.priority_tree = ttk.Treeview(priority_tree_frame, columns=("Time to Failure", "P10 / P50 / P90", "Object"), show="headings", height=5)
+        self.priority_tree.heading("Time to Failure", text="Time to Failure"); self.priority_tree.heading("P10 / P50 / P90", text="P10 / P50 / P90"); self.priority_tree.heading("Object", text="Object")
+        self.priority_tree.column("Time to Failure", width=120, anchor='w'); self.priority_tree.column("P10 / P50 / P90", width=200, anchor='w'); self.priority_tree.column("Object", width=280, anchor='w')
         self.priority_tree.grid(row=0, column=0, sticky='nsew')
         priority_scroll = ttk.Scrollbar(priority_tree_frame, orient="vertical", command=self.priority_tree.yview)
         priority_scroll.grid(row=0, column=1, sticky='ns')
@@ -213,18 +268,175 @@ class VultureTrackerApp:
         try:
             capture = self.capture_queue.get_nowait()
             if "error" in capture: self.log_error(source="Hotkey Listener", error_data=capture["error"])
-            else: self.last_capture_data = capture; self.populate_form_with_capture()
+            else:
+                # The form holds one capture at a time, so a new one supersedes any unsaved predecessor.
+                if self.last_capture_data and self.last_capture_data.get("journal_seq") is not None:
+                    self.journal.mark_consumed(self.last_capture_data["journal_seq"])
+                # A wrecked object has no health to save, so there is nothing worth journaling.
+                capture["journal_seq"] = self.journal.append(capture) if self._is_savable(capture) else None
+                self.last_capture_data = capture; self.populate_form_with_capture()
         except queue.Empty: pass
         finally: self.root.after(100, self.check_capture_queue)
 
+    def backup_database(self, quiet=False):
+        started = self.backup.start(progress_callback=lambda done, total: self.backup_queue.put(("progress", done, total)),
+                                    done_callback=lambda path, error: self.backup_queue.put(("done", path, error)))
+        if not started and not quiet:
+            messagebox.showinfo("Backup", "A backup is already running.")
+
+    def _auto_backup(self):
+        last_backup = self.backup.latest_backup_time()
+        if not last_backup or datetime.now() - last_backup >= timedelta(hours=self.BACKUP_INTERVAL_H):
+            self.backup_database(quiet=True)
+
+    def check_backup_queue(self):
+        try:
+            while True:
+                event = self.backup_queue.get_nowait()
+                if event[0] == "progress":
+                    _, done, total = event
+                    self.status_label.config(text=f"Backing up database... {done * 100 // max(total, 1)}%")
+                else:
+                    _, path, error = event
+                    if error:
+                        self.status_label.config(text="Database backup failed.")
+                        self.log_error(source="Database Backup", error_data=str(error))
+                    else:
+                        self.status_label.config(text=f"Backup saved: {os.path.basename(path)}")
+        except queue.Empty: pass
+        finally: self.root.after(200, self.check_backup_queue)
+
+    def check_image_writer(self):
+        self._apply_image_write_results()
+        self.root.after(100, self.check_image_writer)
+
+    def _apply_image_write_results(self):
+        for history_id, location, error in self.image_writer.poll():
+            image_ref = self.db.mark_image_written(history_id, error, location)
+            for seq in self.journal_waiting.pop(image_ref, []): self.journal.mark_consumed(seq)
+            if error:
+                self.status_label.config(text=f"Failed to save the screenshot for data point {history_id}.")
+                self.log_error(source="Image Writer", error_data=f"{history_id}: {error}")
+
+    def check_image_files(self):
+        # Files already queued for deletion and the map image are not screenshots to check.
+        ignored = [path for _, path in self.db.get_file_tombstones(-1)]
+        main_map_path = self.db.get_config("main_map_path")
+        if main_map_path: ignored.append(main_map_path)
+        started = self.image_scanner.start(self.db.get_image_file_refs(), ignored,
+                                           progress_callback=lambda files: self.scan_queue.put(("progress", files, None)),
+                                           done_callback=lambda report, error: self.scan_queue.put(("done", report, error)))
+        if not started:
+            messagebox.showinfo("Check Screenshot Files", "A check is already running.")
+            return
+        self.status_label.config(text="Checking screenshot files...")
+        self.root.after(200, self.check_scan_queue)
+
+    def check_scan_queue(self):
+        try:
+            while True:
+                event = self.scan_queue.get_nowait()
+                if event[0] == "progress":
+                    self.status_label.config(text=f"Checking screenshot files... {event[1]} scanned")
+                else:
+                    self._review_image_scan(event[1], event[2])
+                    return
+        except queue.Empty: pass
+        self.root.after(200, self.check_scan_queue)
+
+    def _review_image_scan(self, report, error):
+        if error:
+            self.status_label.config(text="Screenshot check failed.")
+            self.log_error(source="Image Scanner", error_data=str(error))
+            return
+        orphans, dangling = report["orphans"], report["dangling"]
+        self.status_label.config(text=f"Checked {report['files_scanned']} screenshot files.")
+        if not orphans and not dangling:
+            messagebox.showinfo("Check Screenshot Files", f"{report['files_scanned']} files checked. No problems found.")
+            return
+        summary = (f"{report['files_scanned']} files checked.\n\n"
+                   f"{len(orphans)} file(s) are not used by any data point ({report['orphan_bytes'] // 1024} KB).\n"
+                   f"{len(dangling)} screenshot reference(s) point to missing files.\n\n"
+                   "Fix these now? Unused files are deleted and missing references are cleared.")
+        if not messagebox.askyesno("Check Screenshot Files", summary): return
+        self.db.tombstone_image_files(orphans)
+        self.db.drop_image_refs(dangling)
+        self.refresh_all_ui()
+
+    def check_file_reaper(self):
+        had_results = self._apply_reaper_results()
+        if not self.file_reaper.is_running():
+            batch = self.db.get_file_tombstones(self.REAP_BATCH)
+            if batch:
+                self.file_reaper.start(batch)
+                self.status_label.config(text=f"Removing deleted screenshots: {self.db.count_file_tombstones()} left.")
+            elif had_results:
+                self.status_label.config(text="Deleted screenshots removed.")
+        self.root.after(self.REAP_POLL_MS, self.check_file_reaper)
+
+    def _apply_reaper_results(self):
+        results = self.file_reaper.poll()
+        for image_ref, error in results:
+            # A file that cannot be removed is reported once rather than retried forever.
+            if error: self.log_error(source="File Reaper", error_data=f"{image_ref}: {error}")
+        if results: self.db.clear_file_tombstones([image_ref for image_ref, _ in results])
+        return bool(results)
+
+    def _run_maintenance_slice(self):
+        # Never compete with a capture that is waiting to be reviewed and saved.
+        if self.last_capture_data is not None or not self.capture_queue.empty():
+            self.root.after(self.MAINTENANCE_RETRY_MS, self._run_maintenance_slice)
+            return
+        try:
+            more = self.maintenance.run_slice()
+        except Exception:
+            self.log_error(source="Database Maintenance")
+            self.root.after(self.MAINTENANCE_INTERVAL_MS, self._run_maintenance_slice)
+            return
+        if more:
+            self.root.after(self.MAINTENANCE_SLICE_GAP_MS, self._run_maintenance_slice)
+        else:
+            retention = self.maintenance.retention
+            print(f"Database maintenance finished: {self.maintenance.pages_reclaimed} pages and {self.maintenance.pack_bytes_reclaimed} image pack bytes reclaimed, "
+                  f"{retention.images_archived} screenshots archived, {retention.points_removed} old data points thinned out.")
+            if self.maintenance.pages_reclaimed or self.maintenance.pack_bytes_reclaimed:
+                self.status_label.config(text=f"Database maintenance reclaimed {self.maintenance.pages_reclaimed} pages and {self.maintenance.pack_bytes_reclaimed // 1024} KB of screenshots.")
+            self.root.after(self.MAINTENANCE_INTERVAL_MS, self._run_maintenance_slice)
+
+    def _restore_unsaved_capture(self):
+        unsaved = self.journal.replay()
+        if not unsaved: return
+        for capture in unsaved[:-1]:
+            self.journal.mark_consumed(capture["journal_seq"])
+        capture = unsaved[-1]
+        if not self._is_savable(capture):
+            self.journal.mark_consumed(capture["journal_seq"])
+            return
+        try:
+            self.last_capture_data = capture
+            self.populate_form_with_capture()
+        except Exception:
+            # A bad entry must never stop the app from starting; drop it instead.
+            self.log_error(source="Capture Journal")
+            self.journal.mark_consumed(capture["journal_seq"])
+            self.last_capture_data = None
+            self.save_button.config(state="disabled")
+            return
+        print("Restored an unsaved capture from the capture journal.")
+
+    @staticmethod
+    def _is_savable(capture):
+        return not isinstance(capture["health_percent"], str)
+
     def populate_form_with_capture(self):
         data = self.last_capture_data
         health = data["health_percent"]
         ts = data["timestamp"].strftime("%Y-%m-%d %I:%M:%S %p")
         roi_pil = Image.fromarray(cv2.cvtColor(data["center_crop"], cv2.COLOR_BGR2RGB)); roi_pil.thumbnail((100, 100))
         photo = ImageTk.PhotoImage(roi_pil); self.photo_references['capture'] = photo
-        self.capture_preview_label.config(image=photo, text=f"Health: {health:.2f}%\n{ts}", compound='top')
-        self.save_button.config(state="normal")
+        health_text = f"{health:.2f}%" if self._is_savable(data) else str(health).capitalize()
+        self.capture_preview_label.config(image=photo, text=f"Health: {health_text}\n{ts}", compound='top')
+        self.save_button.config(state="normal" if self._is_savable(data) else "disabled")
 
         sietches = self.db.get_sietches()
         if not self.sietch_var.get() and sietches:
@@ -243,8 +455,21 @@ class VultureTrackerApp:
             messagebox.showerror("Error", "Sietch, Location, and Object ID are required.")
             return
         self.db.add_location(data_to_save["sietch"], data_to_save["location_id"])
-        success, message = self.db.save_data_point(data_to_save, self.image_folder)
+        duplicate = self.db.find_near_duplicate(data_to_save)
+        if duplicate and not messagebox.askyesno("Possible Duplicate",
+                f"This capture looks like the one saved at {duplicate['timestamp'].strftime('%Y-%m-%d %H:%M')} "
+                f"({duplicate['health']:.2f}%).\n\nSave it anyway?"):
+            self.journal.mark_consumed(self.last_capture_data["journal_seq"])
+            self.last_capture_data = None
+            self.save_button.config(state="disabled")
+            self.status_label.config(text="Duplicate capture discarded.")
+            return
+        success, message = self.db.save_data_point(data_to_save, self.image_writer)
         if success:
+            # Until the writer pool has made the crop durable, the journal entry is the only copy.
+            image_ref = ImageStore.content_ref(data_to_save["roi_image"])
+            if self.db.is_image_pending(image_ref): self.journal_waiting.setdefault(image_ref, []).append(self.last_capture_data["journal_seq"])
+            else: self.journal.mark_consumed(self.last_capture_data["journal_seq"])
             messagebox.showinfo("Success", "Data point saved successfully!")
             self.last_capture_data = None
             self.save_button.config(state="disabled")
@@ -267,11 +492,24 @@ class VultureTrackerApp:
             self.location_var.set("")
 
     def refresh_all_ui(self):
+        if self.change_seq is None:
+            self.change_seq = self.db.register_change_consumer("ui")
+            changed_entities = None
+        else:
+            changes = self.db.changes_since(self.change_seq)
+            if changes:
+                self.change_seq = changes[-1][0]
+                self.db.ack_changes("ui", self.change_seq)
+            changed_entities = {entity for _, entity, _, _, _ in changes}
+            self.projection_cache.apply_changes(changes)
+
         self.refresh_sietch_list()
         self.on_sietch_select() # Update location list based on current sietch
-        self.refresh_object_tree()
+        # New captures only touch history; the tree and pins depend on sietches, locations and objects.
+        if changed_entities is None or changed_entities - {"history"}:
+            self.refresh_object_tree()
+            if hasattr(self, 'map_frame'): self.map_frame.load_pins()
         self.refresh_priority_watch_list()
-        if hasattr(self, 'map_frame'): self.map_frame.load_pins()
 
     def refresh_sietch_list(self):
         sietches = self.db.get_sietches()
@@ -427,10 +665,10 @@ class VultureTrackerApp:
             ttk.Label(self.graph_frame, text="Select an object from the list to view its history.").pack()
 
     def _adjust_health(self, history_id, sietch, location, obj_id):
-        current_health_row = self.db.query("SELECT health_percent FROM history WHERE id = ?", (history_id,)).fetchone()
-        if not current_health_row: return
+        current_health = self.db.get_history_health(history_id)
+        if current_health is None: return
 
-        new_health = simpledialog.askfloat("Adjust Health", "Enter the correct health percentage:", parent=self.root, minvalue=0.0, maxvalue=100.0, initialvalue=current_health_row[0])
+        new_health = simpledialog.askfloat("Adjust Health", "Enter the correct health percentage:", parent=self.root, minvalue=0.0, maxvalue=100.0, initialvalue=current_health)
         if new_health is not None:
             self.db.update_history_health(history_id, new_health)
             self.display_object_history(sietch, location, obj_id)
@@ -441,44 +679,34 @@ class VultureTrackerApp:
             self.display_object_history(sietch, location, obj_id)
 
     def refresh_priority_watch_list(self):
-        for i in self.priority_tree.get_children():
-            self.priority_tree.delete(i)
+        # One timer at a time: it is re-armed for the next moment the list will look different.
+        if self.watch_timer is not None:
+            self.root.after_cancel(self.watch_timer)
+            self.watch_timer = None
 
-        all_objects = self.db.get_all_objects_with_sietch_and_location()
-        projections = []
         now = datetime.now()
-
-        for sietch, location, obj_id in all_objects:
-            history = self.db.get_history_for_object(sietch, location, obj_id)
-            if len(history) < 2: continue
-
-            # Estimate current health based on simple decay first
-            last_point, second_last_point = history[-1], history[-2]
-            time_delta_hours_lin = (last_point['timestamp'] - second_last_point['timestamp']).total_seconds() / 3600
-            health_delta_lin = second_last_point['health'] - last_point['health']
-
-            current_health_estimate = last_point['health']
-            if time_delta_hours_lin > 0 and health_delta_lin > 0:
-                decay_rate_per_hour = health_delta_lin / time_delta_hours_lin
-                hours_since_last = (now - last_point['timestamp']).total_seconds() / 3600
-                current_health_estimate = max(0, last_point['health'] - (decay_rate_per_hour * hours_since_last))
-
-            if current_health_estimate <= 0: continue
-
-            # Now calculate DSC projections with the estimated current health
-            dsc_projs = self._calculate_dsc_projections(history, current_health_estimate)
-            if dsc_projs:
-                projections.append({
-                    "failure_time": dsc_projs['worst'],
-                    "object_str": f"{sietch} / {location} / {obj_id}"
-                })
-
-        projections.sort(key=lambda x: x['failure_time'])
-
-        for proj in projections[:10]: # Display top 10
-            time_to_failure = proj['failure_time'] - now
-            if time_to_failure.total_seconds() > 0:
-                self.priority_tree.insert("", "end", values=(self._format_timedelta(time_to_failure), proj['object_str']))
+        projections = self.projection_cache.project(now.timestamp())
+        rows, next_change_h = self.priority_watch.update(projections)
+        bands = self.projection_engine.failure_bands(projections, self.projection_cache.spread(projections['object_pk'][rows]), rows)
+        band_change_h = self.priority_watch.band_change(projections, rows, bands)
+        if band_change_h is not None: next_change_h = band_change_h if next_change_h is None else min(next_change_h, band_change_h)
+        values = []
+        for n, i in enumerate(rows):
+            key = self.db.get_object_key(int(projections['object_pk'][i]))
+            if not key: continue
+            band = " / ".join(self._format_timedelta(timedelta(hours=float(bands[p][n]))) if not np.isnan(bands[p][n]) else "-" for p in ("p10", "p50", "p90"))
+            values.append((self._format_timedelta(timedelta(hours=float(projections['worst'][i]))), band, " / ".join(key)))
+
+        # Rows are rewritten in place, and only where their text changed.
+        items = self.priority_tree.get_children()
+        for item, row in zip(items, values):
+            if tuple(self.priority_tree.item(item, 'values')) != row: self.priority_tree.item(item, values=row)
+        for item in items[len(values):]: self.priority_tree.delete(item)
+        for row in values[len(items):]: self.priority_tree.insert("", "end", values=row)
+
+        if next_change_h is not None:
+            delay_ms = min(max(int(next_change_h * 3600 * 1000) + 1, self.WATCH_MIN_DELAY_MS), self.WATCH_MAX_DELAY_MS)
+            self.watch_timer = self.root.after(delay_ms, self.refresh_priority_watch_list)
 
     def _format_timedelta(self, td):
         days, remainder = divmod(td.total_seconds(), 86400)
@@ -486,24 +714,53 @@ class VultureTrackerApp:
         return f"{int(days)}d, {int(hours)}h"
 
     def _calculate_dsc_projections(self, history, current_health_estimate):
-        if len(history) < 2: return None
-        first_obs, last_obs = history[0], history[-1]
-        time_elapsed_hours = (last_obs['timestamp'] - first_obs['timestamp']).total_seconds() / 3600
-        if time_elapsed_hours <= 0: return None
-        estimated_scs = time_elapsed_hours / self.AVG_STORM_CYCLE_HOURS
-        if estimated_scs <= 0: return None
-        total_damage = first_obs['health'] - last_obs['health']
-        if total_damage <= 0: return None
-        dsc = total_damage / estimated_scs
-        if dsc <= 0: return None
-        remaining_scs = current_health_estimate / dsc
+        if len(history['timestamp']) < 2: return None
+        hours = self.projection_engine.dsc_hours(ProjectionEngine.inputs_from_history(history), np.array([current_health_estimate], dtype=np.float64))
+        if np.isnan(hours['worst'][0]): return None
         now = datetime.now()
+        return {key: now + timedelta(hours=float(value[0])) for key, value in hours.items()}
+
+    def _decay_fits(self, obj_pks=None):
+        """Fitted decay lines for every object, or those in `obj_pks`, in the configured fit mode; None in "endpoints" mode."""
+        if self.decay_fit == "online":
+            return self.projection_engine.fits_from_sums(self.db.get_decay_sums(obj_pks))
+        if self.decay_fit == "robust":
+            return self.projection_engine.fit_decay(self.db.get_all_history_arrays(obj_pks))
+        return None
+
+    def _load_projection_inputs(self, obj_pks=None):
+        fits = self._decay_fits(obj_pks)
+        return fits if fits is not None else self.db.get_projection_inputs(obj_pks)
+
+    def _project_rows(self, inputs, now_ts):
+        if self.decay_fit in ("robust", "online"): return self.projection_engine.project_fits(inputs, now_ts)
+        return self.projection_engine.project(inputs, now_ts)
+
+    def _damage_spread(self, obj_pks):
+        # Read only for the objects whose bands are shown, and cached by the projection cache until they change.
+        return self.projection_engine.damage_spread(self.db.get_all_history_arrays(obj_pks), obj_pks)
+
+    def _calculate_fitted_projections(self, obj_pk, first_ts, now):
+        """Fitted-line counterpart of `_calculate_dsc_projections`, also returning the line from `first_ts` to the last point."""
+        fits = self._decay_fits([obj_pk])
+        hours = self.projection_engine.project_fits(fits, now.timestamp())
+        if not len(hours['worst']) or np.isnan(hours['worst'][0]): return None
+        first_hours = (float(first_ts) - float(fits['last_ts'][0])) / 3600
         return {
-            "worst": now + timedelta(hours=remaining_scs * self.MIN_STORM_INTERVAL_H),
-            "median": now + timedelta(hours=remaining_scs * self.AVG_STORM_CYCLE_HOURS),
-            "latest": now + timedelta(hours=remaining_scs * self.MAX_STORM_INTERVAL_H),
+            "current_health": float(hours['current_health'][0]),
+            "first_level": float(fits['level'][0]) - float(fits['rate'][0]) * first_hours,
+            "last_level": float(fits['level'][0]),
+            **{key: now + timedelta(hours=float(hours[key][0])) for key in ("worst", "median", "latest")}
         }
 
+    def _calculate_failure_bands(self, obj_pk, now):
+        """Monte Carlo P10/P50/P90 failure times for one object, as datetimes, or None if it has no projection."""
+        projections = self._project_rows(self._load_projection_inputs([obj_pk]), now.timestamp())
+        if not len(projections['object_pk']): return None
+        bands = self.projection_engine.failure_bands(projections, self.projection_cache.spread(projections['object_pk']))
+        if np.isnan(bands['p50'][0]): return None
+        return {key: now + timedelta(hours=float(values[0])) for key, values in bands.items()}
+
     def display_object_history(self, sietch, location, selected_object):
         if self.graph_canvas:
             self.graph_canvas.get_tk_widget().destroy()
@@ -520,41 +777,58 @@ class VultureTrackerApp:
         history_container.grid(row=1, column=0, sticky="nsew")
 
         history = self.db.get_history_for_object(sietch, location, selected_object)
+        obj_pk = self.db.get_object_pk_by_name(sietch, location, selected_object)
+        series = self.db.get_history_arrays(obj_pk, max_points=self.GRAPH_MAX_POINTS)
 
-        if len(history) < 2:
+        if len(series['id']) < 2:
             ttk.Label(graph_container, text="Not enough data to plot a graph.").pack(expand=True)
         else:
             fig = Figure(figsize=(5, 3), dpi=100)
             fig.patch.set_facecolor('#1f2937')
             ax = fig.add_subplot(111)
-            last_point, second_last_point = history[-1], history[-2]
-            time_delta_hours = (last_point['timestamp'] - second_last_point['timestamp']).total_seconds() / 3600
-            health_delta = second_last_point['health'] - last_point['health']
+            timestamps = [datetime.fromtimestamp(t) for t in series['timestamp'].tolist()]; healths = series['health'].tolist()
+            last_time, last_health = timestamps[-1], healths[-1]
+            time_delta_hours = (timestamps[-1] - timestamps[-2]).total_seconds() / 3600
+            health_delta = healths[-2] - last_health
             decay_rate_per_hour = (health_delta / time_delta_hours) if (time_delta_hours > 0 and health_delta > 0) else 0
             if decay_rate_per_hour > 0:
-                hours_to_failure = last_point['health'] / decay_rate_per_hour
-                failure_date = last_point['timestamp'] + timedelta(hours=hours_to_failure)
-                ax.plot([last_point['timestamp'], failure_date], [last_point['health'], 0], 'b-', label='Projected Decay')
-            timestamps = [h['timestamp'] for h in history]; healths = [h['health'] for h in history]
+                hours_to_failure = last_health / decay_rate_per_hour
+                failure_date = last_time + timedelta(hours=hours_to_failure)
+                ax.plot([last_time, failure_date], [last_health, 0], 'b-', label='Projected Decay')
             ax.plot(timestamps, healths, 'g-o', label='Actual Decay', markersize=4)
+            # Hourly min/max band from the rollups keeps spikes visible when the series above is thinned.
+            rollup = self.db.get_object_rollup(obj_pk)
+            if len(rollup['bucket_start']) > 1:
+                bucket_times = [datetime.fromtimestamp(t) for t in rollup['bucket_start'].tolist()]
+                ax.fill_between(bucket_times, rollup['min'], rollup['max'], step='post', color='#22c55e', alpha=0.15, label='Hourly Range')
             now = datetime.now()
-            hours_since_last_capture = (now - last_point['timestamp']).total_seconds() / 3600
-            current_health_estimate = last_point['health'] - (decay_rate_per_hour * hours_since_last_capture) if decay_rate_per_hour > 0 else last_point['health']
+            hours_since_last_capture = (now - last_time).total_seconds() / 3600
+            current_health_estimate = last_health - (decay_rate_per_hour * hours_since_last_capture) if decay_rate_per_hour > 0 else last_health
             current_health_estimate = max(0, current_health_estimate)
-            if current_health_estimate < last_point['health']: ax.plot([last_point['timestamp'], now], [last_point['health'], current_health_estimate], 'g-')
-            if current_health_estimate > 0:
-                projections = self._calculate_dsc_projections(history, current_health_estimate)
+            if current_health_estimate < last_health: ax.plot([last_time, now], [last_health, current_health_estimate], 'g-')
+            projections = None
+            if self.decay_fit in ("robust", "online"):
+                projections = self._calculate_fitted_projections(obj_pk, series['timestamp'][0], now)
                 if projections:
-                    ax.plot([now, projections['worst']], [current_health_estimate, 0], 'g:', label='DSC: W')
-                    ax.plot([now, projections['median']], [current_health_estimate, 0], 'y:', label='DSC: M')
-                    ax.plot([now, projections['latest']], [current_health_estimate, 0], 'r:', label='DSC: L')
+                    current_health_estimate = projections['current_health']
+                    ax.plot([timestamps[0], last_time], [projections['first_level'], projections['last_level']], 'c--', label=f"{self.decay_fit.title()} Fit")
+            elif current_health_estimate > 0:
+                projections = self._calculate_dsc_projections(series, current_health_estimate)
+            if projections:
+                ax.plot([now, projections['worst']], [current_health_estimate, 0], 'g:', label='DSC: W')
+                ax.plot([now, projections['median']], [current_health_estimate, 0], 'y:', label='DSC: M')
+                ax.plot([now, projections['latest']], [current_health_estimate, 0], 'r:', label='DSC: L')
+                bands = self._calculate_failure_bands(obj_pk, now)
+                if bands:
+                    ax.fill([now, bands['p10'], bands['p90']], [current_health_estimate, 0, 0], color='#facc15', alpha=0.12, label='P10-P90')
+                    ax.plot([bands['p50']], [0], 'yv', markersize=6, label='P50')
             ax.set_facecolor('#0f172a'); ax.tick_params(axis='x', colors='white', labelsize=8); ax.tick_params(axis='y', colors='white', labelsize=8)
             for spine in ax.spines.values(): spine.set_color('white')
             ax.set_xlabel("Date", color='white', fontsize=10); ax.set_ylabel("Health %", color='white', fontsize=10)
             ax.set_title(f"Decay History for {selected_object}", color='white', fontsize=12)
             ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M')); fig.autofmt_xdate(rotation=30)
             ax.grid(True, which='both', linestyle='--', linewidth=0.5, color='#475569')
-            ax.set_ylim(0, max(h['health'] for h in history) * 1.05 if history else 100)
+            ax.set_ylim(0, max(healths) * 1.05)
             legend = ax.legend(facecolor='#1f2937', edgecolor='white', fontsize=8)
             for text in legend.get_texts(): text.set_color('white')
             fig.tight_layout(pad=1.5)
@@ -575,17 +849,19 @@ class VultureTrackerApp:
             point_frame = ttk.Frame(history_frame.scrollable_frame, padding=5)
             point_frame.pack(fill='x', expand=True, pady=2)
             point_frame.columnconfigure(1, weight=1)
-            img_path = point.get("image_path")
             thumb_label = ttk.Label(point_frame)
-            if img_path and os.path.exists(img_path):
+            # Precomputed thumbnails are used as they are; only screenshots not yet processed by maintenance are decoded here.
+            thumbnail = point.get("thumbnail")
+            crop = None if thumbnail else self.db.read_image(point.get("image_ref"))
+            if thumbnail or crop is not None:
                 try:
-                    img = Image.open(img_path)
+                    img = Image.open(io.BytesIO(thumbnail)) if thumbnail else Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
                     img.thumbnail((50, 50))
                     photo_key = f"history_{point['id']}"
                     self.photo_references[photo_key] = ImageTk.PhotoImage(img)
                     thumb_label.config(image=self.photo_references[photo_key])
                 except Exception as e:
-                    self.log_error("Image Loading", f"Failed to load {img_path}: {e}")
+                    self.log_error("Image Loading", f"Failed to load the screenshot for data point {point['id']}: {e}")
             thumb_label.grid(row=0, column=0, sticky='w', padx=(0, 10))
             info_text = f"Health: {point['health']:.2f}%  -  {point['timestamp'].strftime('%Y-%m-%d %H:%M')}"
             ttk.Label(point_frame, text=info_text).grid(row=0, column=1, sticky='w')
@@ -603,6 +879,11 @@ class VultureTrackerApp:
         self.map_frame.load_map()
 
     def on_closing(self):
+        self.image_writer.shutdown()
+        self._apply_image_write_results()
+        self.file_reaper.join()
+        self._apply_reaper_results()
+        self.journal.close()
         self.db.close()
         self.root.destroy()
 
@@ -0,0 +1,63 @@
+class DatabaseMaintenance:
+    """
+    Idle-time upkeep for the tracker database, split into short slices.
+
+    One pass applies the retention policy, if any, then compacts image pack segments that
+    are mostly dead space, one segment per slice. It backfills the raw crop array (when
+    enabled), history thumbnails and perceptual hashes a batch per slice, reclaims free
+    pages with `PRAGMA incremental_vacuum`, refreshes planner statistics table by table
+    with `ANALYZE`, and finishes with `PRAGMA optimize`. The caller decides when a slice
+    may run; each slice touches the database only briefly so it can be driven from the Tk
+    event loop between user actions.
+    """
+    VACUUM_PAGES_PER_SLICE = 256
+    ANALYSIS_LIMIT = 1000
+    PACK_MIN_DEAD_RATIO = 0.5
+    CROP_FILL_BATCH = 256
+    THUMBNAIL_FILL_BATCH = 64
+    PHASH_FILL_BATCH = 256
+
+    def __init__(self, db, retention=None):
+        self.db = db
+        self.retention = retention
+        self.pages_reclaimed = 0
+        self.pack_bytes_reclaimed = 0
+        self._steps = None
+
+    def is_running(self):
+        return self._steps is not None
+
+    def run_slice(self):
+        """Runs one slice of the current pass, starting a new pass if needed. Returns False when the pass is complete."""
+        if self._steps is None:
+            self.pages_reclaimed = 0
+            self.pack_bytes_reclaimed = 0
+            self._steps = self._maintenance_pass()
+        try:
+            next(self._steps)
+            return True
+        except StopIteration:
+            self._steps = None
+            return False
+
+    def _maintenance_pass(self):
+        if self.retention: yield from self.retention.steps()
+        for tier, segment in self.db.image_pack_segments_to_compact(self.PACK_MIN_DEAD_RATIO):
+            self.pack_bytes_reclaimed += self.db.compact_image_pack_segment(tier, segment)
+            yield
+        while self.db.fill_crop_array(self.CROP_FILL_BATCH):
+            yield
+        while self.db.fill_thumbnails(self.THUMBNAIL_FILL_BATCH):
+            yield
+        while self.db.fill_perceptual_hashes(self.PHASH_FILL_BATCH):
+            yield
+        while True:
+            reclaimed = self.db.incremental_vacuum(self.VACUUM_PAGES_PER_SLICE)
+            self.pages_reclaimed += reclaimed
+            if reclaimed < self.VACUUM_PAGES_PER_SLICE: break
+            yield
+        for table in self.db.get_table_names():
+            yield
+            self.db.analyze_table(table, self.ANALYSIS_LIMIT)
+        yield
+        self.db.optimize()
@@ -0,0 +1,432 @@
+import numpy as np
+
+class ProjectionEngine:
+    """
+    Failure projections for many objects at once.
+
+    Inputs are the columnar arrays from `DatabaseManager.get_projection_inputs()` (or
+    `inputs_from_history()` for a single object): the first, previous and last point of
+    every object. Each step is a handful of whole-array operations, so projecting the
+    entire base costs about as much as projecting one object used to.
+
+    - The current health is the last reading decayed at the rate between the last two
+      points, when that rate is positive.
+    - The DSC (damage per storm cycle) projections spread the damage between the first and
+      last point over storm cycles of `avg_cycle_h` and return the hours until the current
+      estimate reaches zero at the shortest, average and longest storm interval.
+
+    Both use only two points per object, so one misread capture can move a projection by
+    days. `fit_decay()` and `project_fits()` are the robust alternative: a straight line is
+    fitted through every point of every object by iteratively reweighted least squares with
+    Tukey's bisquare weights, so outliers end up with no weight at all, and the projections
+    follow the fitted line instead of the endpoints.
+
+    `fits_from_sums()` gives the same line from running least-squares sums kept per object
+    in the database, so an online fit costs O(1) per object whatever its history length.
+    It is plain least squares: unlike the robust fit, an outlier keeps its full weight.
+
+    `failure_bands()` puts percentiles on the median projection by Monte Carlo: per object,
+    the damage per storm cycle varies as much as its history shows (`damage_spread()`) and
+    every storm interval is drawn between the shortest and longest one.
+    """
+    FIT_ITERATIONS = 5
+    # Bisquare tuning constant, in units of the robust residual scale (95% efficiency on clean data).
+    FIT_TUNING = 4.685
+    # Floor on the residual scale, in health percent, so points lying exactly on a line do not
+    # make every other point look like an outlier.
+    FIT_MIN_SCALE = 0.1
+    MC_SAMPLES = 500
+    # Fixed so that refreshing the same projections gives the same bands.
+    MC_SEED = 0
+
+    def __init__(self, avg_cycle_h=0.875, min_interval_h=0.75, max_interval_h=1.0):
+        self.avg_cycle_h = avg_cycle_h
+        self.min_interval_h = min_interval_h
+        self.max_interval_h = max_interval_h
+
+    @staticmethod
+    def inputs_from_history(history):
+        """Builds one-object inputs from a `get_history_arrays()` result with at least two points."""
+        timestamps, healths = history['timestamp'], history['health']
+        return {
+            "object_pk": np.zeros(1, dtype=np.int64),
+            "first_ts": timestamps[:1], "first_health": healths[:1],
+            "prev_ts": timestamps[-2:-1], "prev_health": healths[-2:-1],
+            "last_ts": timestamps[-1:], "last_health": healths[-1:]
+        }
+
+    def decay_rate(self, inputs):
+        """Returns the health lost per hour between the last two points of every object, 0 where it did not drop."""
+        last_health = inputs['last_health'].astype(np.float64)
+        hours = (inputs['last_ts'] - inputs['prev_ts']) / 3600
+        damage = inputs['prev_health'].astype(np.float64) - last_health
+        decaying = (hours > 0) & (damage > 0)
+        return np.divide(damage, hours, out=np.zeros_like(last_health), where=decaying)
+
+    def current_health(self, inputs, now_ts):
+        """Returns the estimated health of every object at epoch second `now_ts`, never below zero."""
+        last_health = inputs['last_health'].astype(np.float64)
+        rate = self.decay_rate(inputs)
+        decaying = rate > 0
+        estimate = np.maximum(0, last_health - rate * ((now_ts - inputs['last_ts']) / 3600))
+        return np.where(decaying, estimate, last_health)
+
+    def dsc_hours(self, inputs, current_health):
+        """
+        Returns a dict of float64 arrays 'worst', 'median' and 'latest': hours from now until
+        failure at the shortest, average and longest storm interval. NaN where the history
+        shows no damage to project from.
+        """
+        elapsed_h = (inputs['last_ts'] - inputs['first_ts']).astype(np.float64) / 3600
+        cycles = elapsed_h / self.avg_cycle_h
+        damage = inputs['first_health'].astype(np.float64) - inputs['last_health'].astype(np.float64)
+        valid = (elapsed_h > 0) & (cycles > 0) & (damage > 0)
+        dsc = np.divide(damage, cycles, out=np.zeros_like(damage), where=valid)
+        valid &= dsc > 0
+        return self._cycle_hours(np.divide(current_health, dsc, out=np.full_like(damage, np.nan), where=valid))
+
+    def _cycle_hours(self, remaining_cycles):
+        return {
+            "worst": remaining_cycles * self.min_interval_h,
+            "median": remaining_cycles * self.avg_cycle_h,
+            "latest": remaining_cycles * self.max_interval_h
+        }
+
+    def project(self, inputs, now_ts):
+        """
+        Projects every object in `inputs` at epoch second `now_ts`.
+
+        Returns:
+            A dict of arrays aligned with the inputs: 'object_pk', 'current_health', the
+            'decay_rate' the current health is falling at (health per hour), and the 'worst',
+            'median' and 'latest' hours from `dsc_hours()`, which are NaN as well for objects
+            estimated to have failed already.
+        """
+        current = self.current_health(inputs, now_ts)
+        hours = self.dsc_hours(inputs, current)
+        failed = current <= 0
+        for key in hours: hours[key][failed] = np.nan
+        return dict(object_pk=inputs['object_pk'], current_health=current, decay_rate=self.decay_rate(inputs), **hours)
+
+    def fit_decay(self, points):
+        """
+        Fits health against time through all points of every object at once.
+
+        Every pass is a few grouped sums (`np.add.reduceat` over the object runs) plus one
+        grouped median of the residuals, so the cost is linear in the number of points.
+
+        Args:
+            points: Per-point arrays 'object_pk', 'timestamp' and 'health', grouped by object
+                and ordered by time within each, as from `DatabaseManager.get_all_history_arrays()`.
+
+        Returns:
+            A dict of arrays with one entry per object: 'object_pk', 'last_ts', 'level' (the
+            fitted health at 'last_ts') and 'rate' (fitted health lost per hour, negative
+            when health rises; NaN when the object's points do not span any time).
+        """
+        object_pk = points['object_pk']
+        if not len(object_pk):
+            return {"object_pk": object_pk[:0], "last_ts": points['timestamp'][:0], "level": np.empty(0), "rate": np.empty(0)}
+        starts = np.flatnonzero(np.r_[True, object_pk[1:] != object_pk[:-1]])
+        counts = np.diff(np.r_[starts, len(object_pk)])
+        group = np.repeat(np.arange(len(starts)), counts)
+        last_ts = points['timestamp'][starts + counts - 1]
+        # Hours relative to each object's last point, so the intercept is the fitted current level.
+        t = (points['timestamp'] - last_ts[group]) / 3600
+        y = points['health'].astype(np.float64)
+        weights = np.ones_like(y)
+
+        for iteration in range(self.FIT_ITERATIONS + 1):
+            total = np.add.reduceat(weights, starts)
+            t_mean = np.add.reduceat(weights * t, starts) / total
+            y_mean = np.add.reduceat(weights * y, starts) / total
+            dt = t - t_mean[group]
+            spread = np.add.reduceat(weights * dt * dt, starts)
+            slope = np.divide(np.add.reduceat(weights * dt * (y - y_mean[group]), starts), spread,
+                              out=np.full_like(spread, np.nan), where=spread > 0)
+            level = y_mean - np.nan_to_num(slope) * t_mean
+            if iteration == self.FIT_ITERATIONS: break
+            residual = np.abs(y - level[group] - np.nan_to_num(slope)[group] * t)
+            # Median absolute residual per object: sort by object and residual in one float key
+            # (group index plus the residual scaled into [0, 1) by the object's own bound, so a fit
+            # does not depend on the other objects in the batch) and take the middle of each run.
+            bound = 2 * np.maximum.reduceat(residual, starts)
+            bound[bound == 0] = 1.0
+            ordered = (np.sort(group + residual / bound[group]) - group) * bound[group]
+            median = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+            scale = np.maximum(1.4826 * median, self.FIT_MIN_SCALE) * self.FIT_TUNING
+            u = residual / scale[group]
+            weights = np.where(u < 1, (1 - u * u) ** 2, 0.0)
+
+        return {"object_pk": object_pk[starts], "last_ts": last_ts, "level": level, "rate": -slope}
+
+    @staticmethod
+    def fits_from_sums(sums):
+        """
+        Solves the least-squares line of every object from `DatabaseManager.get_decay_sums()`.
+
+        Returns:
+            The same dict as `fit_decay()`.
+        """
+        n = sums['n'].astype(np.float64)
+        spread = n * sums['sum_tt'] - sums['sum_t'] ** 2
+        # Rounding in the running sums can leave a few ulps where the points span no time at all.
+        valid = (n > 1) & (spread > 1e-9 * np.maximum(n * sums['sum_tt'], 1))
+        slope = np.divide(n * sums['sum_th'] - sums['sum_t'] * sums['sum_h'], spread, out=np.full_like(n, np.nan), where=valid)
+        intercept = np.divide(sums['sum_h'] - np.nan_to_num(slope) * sums['sum_t'], n, out=np.full_like(n, np.nan), where=n > 0)
+        last_t = (sums['last_ts'] - sums['origin_ts']) / 3600
+        return {"object_pk": sums['object_pk'], "last_ts": sums['last_ts'], "level": intercept + np.nan_to_num(slope) * last_t, "rate": -slope}
+
+    def project_fits(self, fits, now_ts):
+        """
+        Projects every object from its `fit_decay()` line at epoch second `now_ts`.
+
+        Returns:
+            The same dict as `project()`: the current health is the fitted level decayed
+            along the line, and the DSC lines spend `rate * avg_cycle_h` per storm cycle.
+        """
+        level = np.maximum(0, fits['level'])
+        rate = fits['rate']
+        decaying = rate > 0
+        hours_since = (now_ts - fits['last_ts']) / 3600
+        current = np.where(decaying, np.maximum(0, level - np.where(decaying, rate, 0) * hours_since), level)
+        valid = decaying & (current > 0)
+        remaining = np.divide(current, rate * self.avg_cycle_h, out=np.full_like(current, np.nan), where=valid)
+        return dict(object_pk=fits['object_pk'], current_health=current, decay_rate=np.where(decaying, rate, 0), **self._cycle_hours(remaining))
+
+    def damage_spread(self, points, object_pks):
+        """
+        Standard deviation of the damage per storm cycle of every object in `object_pks`,
+        from its history.
+
+        Each gap between consecutive points spans dt / avg_cycle_h storm cycles. If damage
+        accrues like a random walk, the damage over c cycles has variance c * sigma^2 around
+        c times the object's mean damage per cycle, so sigma^2 is estimated from the scaled
+        squared deviations of all its gaps. Objects with fewer than two gaps get 0.
+
+        Args:
+            points: Per-point arrays as for `fit_decay()`.
+            object_pks: The objects to return the spread for, in the caller's order.
+        """
+        object_pk = points['object_pk']
+        result = np.zeros(len(object_pks))
+        if len(object_pk) < 2: return result
+        keys, group = np.unique(object_pk, return_inverse=True)
+        cycles = np.diff(points['timestamp']) / 3600 / self.avg_cycle_h
+        damage = -np.diff(points['health'].astype(np.float64))
+        gap = (object_pk[1:] == object_pk[:-1]) & (cycles > 0)
+        group, cycles, damage = group[1:][gap], cycles[gap], damage[gap]
+        gaps = np.bincount(group, minlength=len(keys))
+        per_cycle = np.bincount(group, damage, len(keys)) / np.maximum(np.bincount(group, cycles, len(keys)), 1e-12)
+        deviation = np.bincount(group, (damage - per_cycle[group] * cycles) ** 2 / cycles, len(keys))
+        sigma = np.where(gaps > 1, np.sqrt(deviation / np.maximum(gaps - 1, 1)), 0.0)
+        pos = np.clip(np.searchsorted(keys, object_pks), 0, len(keys) - 1)
+        found = keys[pos] == object_pks
+        result[found] = sigma[pos[found]]
+        return result
+
+    def failure_bands(self, projections, spread, rows=None, percentiles=(10, 50, 90), samples=MC_SAMPLES):
+        """
+        Monte Carlo percentiles of the hours until failure.
+
+        For every object and sample, the number of storm cycles until the accumulated damage
+        reaches the current health is drawn from the first-passage distribution of a random
+        walk with the object's mean damage per cycle and spread `spread` (an inverse Gaussian),
+        and the hours those cycles take from the sum of as many storm intervals uniform
+        between the shortest and longest one (normal, by the central limit theorem). All
+        objects and samples are drawn as one array.
+
+        Args:
+            projections: A dict from `project()` or `project_fits()`; the mean damage per cycle
+                is the one behind its 'median' projection.
+            spread: Damage spread from `damage_spread()` of the objects simulated, aligned
+                with `rows`.
+            rows: Optional indices of the objects to simulate; all of them by default.
+
+        Returns:
+            A dict mapping 'p10', 'p50', 'p90' (one key per percentile) to arrays of hours,
+            aligned with `rows`; NaN where there is no projection.
+        """
+        rows = np.arange(len(projections['object_pk'])) if rows is None else np.asarray(rows, dtype=np.int64)
+        bands = {f"p{p}": np.full(len(rows), np.nan) for p in percentiles}
+        median, current = projections['median'][rows], projections['current_health'][rows]
+        valid = np.flatnonzero(median > 0)
+        if not len(valid): return bands
+        rng = np.random.default_rng(self.MC_SEED)
+        mean_cycles = (median[valid] / self.avg_cycle_h)[:, None]
+        sigma = np.asarray(spread, dtype=np.float64)[valid][:, None]
+        # Wald shape: (distance to failure / spread)^2; without spread the walk is deterministic.
+        shape = np.divide(current[valid][:, None] ** 2, sigma ** 2, out=np.ones_like(sigma), where=sigma > 0)
+        cycles = rng.wald(np.broadcast_to(mean_cycles, (len(valid), samples)), np.broadcast_to(shape, (len(valid), samples)))
+        cycles = np.where(sigma > 0, cycles, mean_cycles)
+        interval_mean = (self.min_interval_h + self.max_interval_h) / 2
+        interval_sd = (self.max_interval_h - self.min_interval_h) / np.sqrt(12)
+        hours = cycles * interval_mean + np.sqrt(cycles) * interval_sd * rng.standard_normal(cycles.shape)
+        hours = np.clip(hours, cycles * self.min_interval_h, cycles * self.max_interval_h)
+        for p, values in zip(percentiles, np.percentile(hours, percentiles, axis=1)):
+            bands[f"p{p}"][valid] = values
+        return bands
+
+
+class ProjectionCache:
+    """
+    Projection inputs for every object, reloaded only for objects whose history changed.
+
+    The cache holds the columnar inputs `load(obj_pks)` returns (endpoint points or fitted
+    lines, one row per object, always with an 'object_pk' column) and, per row, the change
+    log sequence number it was loaded at. `apply_changes()` marks objects stale from change
+    log rows, and `project()` reloads just those before handing the whole set to
+    `project_rows(inputs, now_ts)`. Projecting from cached inputs is a few array operations,
+    so a refresh costs one small read per changed object. Only the inputs are cached, not
+    the projections: the current-health estimate moves with the clock.
+
+    The damage spread behind the failure bands, read with `load_spread(obj_pks)`, is cached
+    per object the same way: `spread()` reads it only for objects changed since it was last
+    read, and whatever marks an object stale drops its spread too.
+    """
+    # Above this fraction of stale objects one full load is cheaper than a filtered one.
+    FULL_RELOAD_FRACTION = 0.25
+
+    def __init__(self, load, project_rows, load_spread=None):
+        self._load = load
+        self._project_rows = project_rows
+        self._load_spread = load_spread
+        self._inputs = None
+        self._spread = {}
+        # Change log position the inputs reflect: one for the last full load, plus the
+        # objects reloaded on their own since.
+        self._loaded_version = 0
+        self._object_versions = {}
+        self._stale = set()
+        self.version = 0
+
+    def invalidate(self, obj_pks=None):
+        """Marks the given objects stale, or the whole cache when obj_pks is None."""
+        if obj_pks is None:
+            self._inputs = None
+            self._spread.clear()
+        else:
+            self._stale.update(obj_pks)
+            for obj_pk in obj_pks: self._spread.pop(obj_pk, None)
+
+    def apply_changes(self, changes):
+        """
+        Marks objects stale from change log rows (seq, entity, key, parent, op) and returns
+        the set of object keys affected. History rows name their object as parent; changes
+        already reflected in a row's inputs are skipped.
+        """
+        affected = set()
+        for seq, entity, key, parent, op in changes:
+            if entity == "history": obj_pk = parent
+            elif entity == "object" and op == "delete": obj_pk = key
+            else: continue
+            if obj_pk is not None and seq > self._version_of(obj_pk): affected.add(obj_pk)
+            self.version = max(self.version, seq)
+        self._stale |= affected
+        for obj_pk in affected: self._spread.pop(obj_pk, None)
+        return affected
+
+    def project(self, now_ts):
+        """Brings stale objects up to date and returns `project_rows()` over every cached object."""
+        if self._inputs is None or len(self._stale) > self.FULL_RELOAD_FRACTION * len(self._inputs['object_pk']):
+            self._inputs = self._load(None)
+            self._loaded_version, self._object_versions = self.version, {}
+        elif self._stale:
+            stale = np.fromiter(self._stale, dtype=np.int64, count=len(self._stale))
+            fresh = self._load(stale)
+            keep = ~np.isin(self._inputs['object_pk'], stale)
+            self._inputs = {name: np.concatenate([column[keep], fresh[name]]) for name, column in self._inputs.items()}
+            self._object_versions.update(dict.fromkeys(self._stale, self.version))
+        self._stale.clear()
+        return self._project_rows(self._inputs, now_ts)
+
+    def spread(self, obj_pks):
+        """Returns the damage spread of the given objects, aligned with them, reading only those not cached."""
+        obj_pks = [int(pk) for pk in obj_pks]
+        missing = [pk for pk in obj_pks if pk not in self._spread]
+        if missing: self._spread.update(zip(missing, self._load_spread(np.array(missing, dtype=np.int64)).tolist()))
+        return np.array([self._spread[pk] for pk in obj_pks], dtype=np.float64)
+
+    def _version_of(self, obj_pk):
+        if self._inputs is None: return self.version
+        return self._object_versions.get(obj_pk, self._loaded_version)
+
+
+class PriorityWatch:
+    """
+    The `size` soonest projected failures, and how long that list stays as it is.
+
+    Every object's time to failure shrinks linearly with the clock while its health keeps
+    falling at the projected rate, each at its own speed. `update()` picks the top rows with
+    `np.partition` instead of sorting every projection, and works out when the list will
+    next look different: when a shown time crosses an hour boundary (the resolution it is
+    displayed at), or when two objects' lines cross and the order or membership changes.
+    The caller can then sleep until exactly that moment.
+    """
+    def __init__(self, size=10, key="worst"):
+        self.size = size
+        self.key = key
+
+    def update(self, projections):
+        """
+        Args:
+            projections: A dict from `ProjectionEngine.project()` or `project_fits()`.
+
+        Returns:
+            (rows, next_change_h): rows is an array of indices into the projections, soonest
+            failure first; next_change_h is the number of hours until the list changes, or
+            None if it never does on its own.
+        """
+        hours = projections[self.key]
+        candidates = np.flatnonzero(hours > 0)
+        if not len(candidates): return candidates, None
+        if len(candidates) > self.size:
+            # Everything up to the size-th time, ties at the cut included, so they can be settled by row below.
+            cutoff = np.partition(hours[candidates], self.size - 1)[self.size - 1]
+            candidates = candidates[hours[candidates] <= cutoff]
+        # Rows are in (sietch, location, object) order; equal times keep it.
+        top = candidates[np.lexsort((candidates, hours[candidates]))][:self.size]
+        speed = self._speed(projections, hours)
+
+        waits = [self._hour_crossings(hours[top], speed[top])]
+        # Adjacent shown rows swap when the later one's time falls faster.
+        first, second = top[:-1], top[1:]
+        closing = speed[second] > speed[first]
+        waits.append((hours[second] - hours[first])[closing] / (speed[second] - speed[first])[closing])
+        # Any other object enters the list when its line crosses the last shown one.
+        last = top[-1]
+        others = np.flatnonzero((hours > hours[last]) & (speed > speed[last]))
+        waits.append((hours[others] - hours[last]) / (speed[others] - speed[last]))
+        waits = np.concatenate(waits)
+        return top, float(waits.min()) if len(waits) else None
+
+    def band_change(self, projections, rows, bands):
+        """
+        Hours until one of the shown failure bands crosses an hour boundary, or None.
+
+        Like the projections, a band scales with the current health, so each shrinks in
+        proportion to its row's own time to failure.
+
+        Args:
+            projections, rows: As passed to and returned by `update()`.
+            bands: The `ProjectionEngine.failure_bands()` of those rows.
+        """
+        hours = projections[self.key]
+        speed = self._speed(projections, hours)[rows]
+        waits = []
+        for values in bands.values():
+            scale = np.divide(values, hours[rows], out=np.zeros_like(values), where=(hours[rows] > 0) & ~np.isnan(values))
+            waits.append(self._hour_crossings(np.nan_to_num(values), speed * scale))
+        waits = np.concatenate(waits) if waits else np.empty(0)
+        return float(waits.min()) if len(waits) else None
+
+    @staticmethod
+    def _speed(projections, hours):
+        # Hours of time to failure lost per hour on the clock; projections scale with current health.
+        current = projections['current_health']
+        return np.divide(projections['decay_rate'] * np.nan_to_num(hours), current, out=np.zeros_like(current), where=current > 0)
+
+    @staticmethod
+    def _hour_crossings(hours, speed):
+        moving = speed > 0
+        return (hours[moving] - np.floor(hours[moving])) / speed[moving]
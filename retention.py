@@ -0,0 +1,54 @@
+import time
+
+class RetentionPolicy:
+    """
+    Age-based tiers for stored captures, applied a small step at a time.
+
+    - Optionally, data points older than `thin_after_days` are thinned to at most
+      `thin_per_day` per object and day. The first point and the last two of every object
+      are always kept, so projections are unaffected.
+    - Optionally, screenshots whose newest data point is older than `archive_after_days`
+      move from the hot image store into the archive pack, recompressed losslessly. They
+      stay viewable; only where their bytes live changes.
+
+    The policy is read from the config keys 'retention_archive_days', 'retention_thin_days'
+    and 'retention_thin_per_day'. Both tiers stay off unless their keys are set.
+    `steps()` yields after every batch so DatabaseMaintenance can interleave it with the UI;
+    an archive batch also stops once ARCHIVE_SLICE_S is spent, as recompressing is slow.
+    """
+    ARCHIVE_BATCH = 64
+    ARCHIVE_SLICE_S = 0.05
+
+    def __init__(self, db, archive_after_days=None, thin_after_days=None, thin_per_day=None):
+        self.db = db
+        self.archive_after_days = archive_after_days
+        self.thin_after_days = thin_after_days
+        self.thin_per_day = thin_per_day
+        self.images_archived = 0
+        self.points_removed = 0
+
+    @classmethod
+    def from_config(cls, db):
+        def number(key, default=None):
+            value = db.get_config(key)
+            return float(value) if value not in (None, "") else default
+        thin_per_day = number("retention_thin_per_day")
+        return cls(db, number("retention_archive_days"), number("retention_thin_days"),
+                   int(thin_per_day) if thin_per_day else None)
+
+    def steps(self):
+        now = time.time()
+        self.images_archived = self.points_removed = 0
+        if self.thin_after_days is not None and self.thin_per_day:
+            cutoff = now - self.thin_after_days * 86400
+            for obj_pk in self.db.get_object_pks():
+                self.points_removed += self.db.thin_history(obj_pk, cutoff, self.thin_per_day)
+                yield
+        if self.archive_after_days is not None:
+            after_ref = ""
+            while True:
+                refs = self.db.archive_images(now - self.archive_after_days * 86400, self.ARCHIVE_BATCH, after_ref, self.ARCHIVE_SLICE_S)
+                if not refs: break
+                self.images_archived += len(refs)
+                after_ref = refs[-1]
+                yield
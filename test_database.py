@@ -0,0 +1,444 @@
+import os
+import tempfile
+import unittest
+import random
+import sqlite3
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+
+from analyzer import HealthAnalyzer
+from database import DatabaseManager
+from projection import ProjectionEngine
+
+class TriggerTestCase(unittest.TestCase):
+    """An in-memory database with two sietches, a few locations and objects, and a helper to add points."""
+
+    OBJECTS_PER_LOCATION = 4
+
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.rng = random.Random(11)
+        self.next_id = 0
+        for sietch in ("North", "South"):
+            self.db.add_sietch(sietch)
+            for location_id in ("A1", "B2"):
+                self.db.add_location(sietch, location_id)
+                loc_pk = self.db.get_location_pk_by_name(sietch, location_id)
+                for n in range(self.OBJECTS_PER_LOCATION):
+                    self.db.query("INSERT INTO objects (location_fk, object_id) VALUES (?, ?)", (loc_pk, f"obj{n}"))
+        self.db.commit()
+
+    def object_pks(self):
+        return [pk for (pk,) in self.db.query("SELECT id FROM objects ORDER BY id")]
+
+    def history_ids(self):
+        return [history_id for (history_id,) in self.db.query("SELECT id FROM history ORDER BY id")]
+
+    def add_point(self, obj_pk, timestamp=None, health_cp=None, image_ref=None):
+        self.next_id += 1
+        # Timestamps are unique across the database, so "the last point" is never a tie.
+        timestamp = timestamp if timestamp is not None else 1_700_000_000 + self.next_id * 97 + self.rng.randint(0, 50) * 3600
+        health_cp = health_cp if health_cp is not None else self.rng.randint(0, 10000)
+        self.db.query("INSERT INTO history (object_fk, timestamp, id, health_cp, image_ref) VALUES (?, ?, ?, ?, ?)",
+                      (obj_pk, timestamp, self.next_id, health_cp, image_ref))
+        return self.next_id
+
+    def random_edits(self, rounds, time_shift):
+        """Random inserts, deletes, health edits, time edits by `time_shift()` seconds and moves to another object."""
+        for _ in range(rounds):
+            ids, objects = self.history_ids(), self.object_pks()
+            action = self.rng.random()
+            if action < 0.45 or not ids:
+                self.add_point(self.rng.choice(objects))
+            elif action < 0.65:
+                self.db.delete_history_point(self.rng.choice(ids))
+            elif action < 0.85:
+                self.db.update_history_health(self.rng.choice(ids), self.rng.randint(0, 10000) / 100)
+            elif action < 0.95:
+                self.db.query("UPDATE history SET timestamp = timestamp + ? WHERE id = ?", (time_shift(), self.rng.choice(ids)))
+            else:
+                self.db.query("UPDATE history SET object_fk = ? WHERE id = ?", (self.rng.choice(objects), self.rng.choice(ids)))
+        self.db.commit()
+
+
+class TestRollupTriggers(TriggerTestCase):
+
+    def _expected_rollups(self):
+        """Recomputes both rollup tables from history, as {key: (min, max, last, last_ts, n)}."""
+        bucket = DatabaseManager.ROLLUP_BUCKET_S
+        rows = self.db.query("""SELECT h.object_fk, o.location_fk, h.timestamp, h.id, h.health_cp
+                                FROM history h JOIN objects o ON h.object_fk = o.id ORDER BY h.timestamp, h.id""").fetchall()
+        expected = {"object_hourly": {}, "location_hourly": {}}
+        for obj_pk, loc_pk, ts, _, health_cp in rows:
+            for table, key in (("object_hourly", (obj_pk, ts // bucket)), ("location_hourly", (loc_pk, ts // bucket))):
+                low, high, _, _, n = expected[table].get(key, (health_cp, health_cp, None, None, 0))
+                expected[table][key] = (min(low, health_cp), max(high, health_cp), health_cp, ts, n + 1)
+        return expected
+
+    def _actual_rollups(self):
+        return {
+            "object_hourly": {(k, h): tuple(v) for k, h, *v in self.db.query("SELECT object_fk, hour, min_cp, max_cp, last_cp, last_ts, n FROM object_hourly")},
+            "location_hourly": {(k, h): tuple(v) for k, h, *v in self.db.query("SELECT location_fk, hour, min_cp, max_cp, last_cp, last_ts, n FROM location_hourly")},
+        }
+
+    def _random_edits(self, rounds):
+        # Moving a point to another hour takes it out of one bucket and into another.
+        self.random_edits(rounds, lambda: self.rng.choice([-2, 1, 3]) * DatabaseManager.ROLLUP_BUCKET_S + 1)
+
+    def test_triggers_track_inserts_deletes_and_edits(self):
+        """Both rollup tables equal a recomputation from history after random edits."""
+        for obj_pk in self.object_pks():
+            for _ in range(10): self.add_point(obj_pk)
+        self._random_edits(400)
+        self.assertEqual(self._actual_rollups(), self._expected_rollups())
+
+    def test_cascades_remove_buckets(self):
+        """Deleting an object or a location drops its buckets and rebuilds the location's."""
+        for obj_pk in self.object_pks():
+            for _ in range(5): self.add_point(obj_pk)
+        self.db.commit()
+        self.db.delete_object(self.object_pks()[0])
+        self.db.delete_location(self.db.get_location_pk_by_name("South", "B2"))
+        self.assertEqual(self._actual_rollups(), self._expected_rollups())
+        self.db.delete_sietch("North")
+        self.assertEqual(self._actual_rollups(), self._expected_rollups())
+
+    def test_backfill_matches_triggers(self):
+        """Rebuilding the rollups from history gives what the triggers kept, last point included."""
+        for obj_pk in self.object_pks():
+            # Several objects per location bucket, so the location's last point has to be picked among them.
+            for hour in range(6):
+                for _ in range(3): self.add_point(obj_pk, timestamp=1_700_000_000 + hour * 3600 + self.rng.randint(0, 3599) * 1000 + obj_pk)
+        self.db.commit()
+        kept = self._actual_rollups()
+        self.assertEqual(kept, self._expected_rollups())
+        self.db._run_migration(self.db.SCHEMA_VERSION, self.db._build_rollups)
+        self.assertEqual(self._actual_rollups(), kept)
+
+
+class TestImageRefcountTriggers(TriggerTestCase):
+
+    REFS = [f"ref{n:02d}.png" for n in range(12)]
+
+    def _store(self, ref, packed):
+        self.stored.add(ref)
+        self.db.query("INSERT OR IGNORE INTO thumbnails (ref, data) VALUES (?, x'00')", (ref,))
+        if packed: self.db.query("UPDATE images SET pack_segment = 0, pack_offset = 0, pack_length = 1 WHERE ref = ?", (ref,))
+
+    def test_refcounts_follow_history(self):
+        """images.refcount counts the rows using each screenshot; released ones lose their thumbnail, and files are tombstoned."""
+        packed, self.stored = set(self.REFS[::3]), set()
+        for obj_pk in self.object_pks():
+            for _ in range(4):
+                ref = self.rng.choice(self.REFS)
+                self.add_point(obj_pk, image_ref=ref)
+                self._store(ref, ref in packed)
+        self.db.commit()
+        for _ in range(200):
+            ids = self.history_ids()
+            action = self.rng.random()
+            if action < 0.4 or not ids:
+                ref = self.rng.choice(self.REFS + [None])
+                self.add_point(self.rng.choice(self.object_pks()), image_ref=ref)
+                if ref: self._store(ref, ref in packed)
+            elif action < 0.7:
+                self.db.delete_history_point(self.rng.choice(ids))
+            else:
+                ref = self.rng.choice(self.REFS + [None])
+                self.db.query("UPDATE history SET image_ref = ? WHERE id = ?", (ref, self.rng.choice(ids)))
+                if ref: self._store(ref, ref in packed)
+        self.db.delete_object(self.object_pks()[0])
+        self.db.delete_location(self.db.get_location_pk_by_name("North", "B2"))
+        self.db.commit()
+
+        in_use = Counter(ref for (ref,) in self.db.query("SELECT image_ref FROM history WHERE image_ref IS NOT NULL"))
+        self.assertEqual(dict(self.db.query("SELECT ref, refcount FROM images").fetchall()), dict(in_use))
+        self.assertEqual({ref for (ref,) in self.db.query("SELECT ref FROM thumbnails")}, set(in_use))
+        tombstones = {ref for (ref,) in self.db.query("SELECT ref FROM file_tombstones")}
+        self.assertFalse(tombstones & packed)
+        self.assertTrue(self.stored - set(in_use) - packed)
+        self.assertLessEqual(self.stored - set(in_use) - packed, tombstones)
+
+
+class TestDecayTriggers(TriggerTestCase):
+
+    def _recomputed_sums(self):
+        """The object_decay sums recomputed from history around each object's stored origin."""
+        origins = dict(self.db.query("SELECT object_fk, origin_ts FROM object_decay"))
+        sums = {}
+        for obj_pk, ts, health_cp in self.db.query("SELECT object_fk, timestamp, health_cp FROM history"):
+            t, h = (ts - origins[obj_pk]) / 3600, health_cp / DatabaseManager.HEALTH_SCALE
+            n, sum_t, sum_h, sum_tt, sum_th = sums.get(obj_pk, (0, 0.0, 0.0, 0.0, 0.0))
+            sums[obj_pk] = (n + 1, sum_t + t, sum_h + h, sum_tt + t * t, sum_th + t * h)
+        return sums
+
+    def _assert_sums_match_history(self):
+        kept = {pk: tuple(v) for pk, *v in self.db.query("SELECT object_fk, n, sum_t, sum_h, sum_tt, sum_th FROM object_decay")}
+        expected = self._recomputed_sums()
+        self.assertEqual(set(kept), set(expected))
+        for obj_pk, values in expected.items():
+            self.assertEqual(kept[obj_pk][0], values[0], f"object {obj_pk} n")
+            for name, got, want in zip(("sum_t", "sum_h", "sum_tt", "sum_th"), kept[obj_pk][1:], values[1:]):
+                self.assertAlmostEqual(got, want, delta=1e-9 * max(1.0, abs(want)), msg=f"object {obj_pk} {name}")
+
+    def _random_edits(self, rounds):
+        self.random_edits(rounds, lambda: -self.rng.randint(1, 500) * 60)
+
+    def test_sums_follow_inserts_deletes_and_edits(self):
+        """The running sums equal a recomputation from history after inserts, deletes, health and time edits and moves."""
+        for obj_pk in self.object_pks():
+            for _ in range(8): self.add_point(obj_pk)
+        self.db.commit()
+        self._assert_sums_match_history()
+        self._random_edits(500)
+        self._assert_sums_match_history()
+
+    def test_sums_follow_cascades(self):
+        """Deleting a point, object, location or sietch takes its points out; emptied objects lose their row."""
+        for obj_pk in self.object_pks():
+            for _ in range(6): self.add_point(obj_pk)
+        self.db.commit()
+        first, second = self.object_pks()[:2]
+        for history_id, in self.db.query("SELECT id FROM history WHERE object_fk = ?", (first,)).fetchall():
+            self.db.delete_history_point(history_id)
+        self.db.delete_object(second)
+        self.assertIsNone(self.db.query("SELECT 1 FROM object_decay WHERE object_fk IN (?, ?)", (first, second)).fetchone())
+        self._assert_sums_match_history()
+        self.db.delete_location(self.db.get_location_pk_by_name("South", "A1"))
+        self._assert_sums_match_history()
+        self.db.delete_sietch("North")
+        self._assert_sums_match_history()
+
+    def test_online_fit_matches_backfill(self):
+        """The fit from trigger-kept sums equals the fit from sums rebuilt from history around a new origin."""
+        for obj_pk in self.object_pks():
+            for _ in range(8): self.add_point(obj_pk)
+        self._random_edits(300)
+        kept = ProjectionEngine.fits_from_sums(self.db.get_decay_sums())
+        self.db._run_migration(self.db.SCHEMA_VERSION, self.db._build_decay_sums)
+        rebuilt = ProjectionEngine.fits_from_sums(self.db.get_decay_sums())
+        self.assertEqual(kept['object_pk'].tolist(), rebuilt['object_pk'].tolist())
+        for name in ("level", "rate"):
+            for got, want in zip(kept[name].tolist(), rebuilt[name].tolist()):
+                self.assertAlmostEqual(got, want, delta=1e-6 * max(1.0, abs(want)))
+
+
+class TestThinHistory(TriggerTestCase):
+
+    DAY_S = 86400
+    FIRST_DAY = 1_700_006_400  # a UTC midnight
+
+    def _timestamps(self, obj_pk):
+        return [ts for (ts,) in self.db.query("SELECT timestamp FROM history WHERE object_fk = ? ORDER BY timestamp, id", (obj_pk,))]
+
+    def test_keeps_per_day_and_the_projection_points(self):
+        """Old days keep at most per_day points; the first point, the last two and everything newer stay."""
+        per_day, cutoff = 3, self.FIRST_DAY + 6 * self.DAY_S
+        objects = self.object_pks()[:3]
+        for n, obj_pk in enumerate(objects):
+            # The last object's points all lie before the cutoff, so its last two are only kept for the projection.
+            # Its final day has twelve points, and every third one would be kept without the pinning.
+            days = 6 if n == 2 else 8
+            for day in range(days):
+                for _ in range(12 if n == 2 and day == days - 1 else self.rng.randint(1, 12)):
+                    self.add_point(obj_pk, timestamp=self.FIRST_DAY + day * self.DAY_S + self.rng.randint(0, self.DAY_S - 1))
+        self.db.commit()
+        before = {obj_pk: self._timestamps(obj_pk) for obj_pk in objects}
+        others = self.db.query("SELECT COUNT(*) FROM history WHERE object_fk NOT IN (?, ?, ?)", objects).fetchone()[0]
+
+        removed = sum(self.db.thin_history(obj_pk, cutoff, per_day) for obj_pk in objects)
+
+        self.assertGreater(removed, 0)
+        self.assertEqual(removed, sum(map(len, before.values())) - sum(len(self._timestamps(obj_pk)) for obj_pk in objects))
+        self.assertEqual(self.db.query("SELECT COUNT(*) FROM history WHERE object_fk NOT IN (?, ?, ?)", objects).fetchone()[0], others)
+        for obj_pk in objects:
+            kept, old = self._timestamps(obj_pk), before[obj_pk]
+            pinned = {old[0], old[-2], old[-1]}
+            self.assertTrue(pinned <= set(kept), f"object {obj_pk}")
+            self.assertEqual([ts for ts in kept if ts >= cutoff], [ts for ts in old if ts >= cutoff])
+            old_days = Counter(ts // self.DAY_S for ts in old if ts < cutoff)
+            kept_days = Counter(ts // self.DAY_S for ts in kept if ts < cutoff and ts not in pinned)
+            for day, count in old_days.items():
+                self.assertLessEqual(kept_days[day], per_day, f"object {obj_pk} day {day}")
+                self.assertGreaterEqual(kept_days[day] + sum(ts // self.DAY_S == day for ts in pinned), min(count, per_day))
+
+
+class TestChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "tracker.db")
+        self.db = DatabaseManager(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        self.folder.cleanup()
+
+    def test_second_process_keeps_unacked_changes(self):
+        """Opening the file again does not drop changes a registered consumer has not applied."""
+        seq = self.db.register_change_consumer("ui")
+        self.db.add_sietch("North")
+        other = DatabaseManager(self.path)
+        other.close()
+        self.assertEqual([(entity, key, op) for _, entity, key, _, op in self.db.changes_since(seq)], [("sietch", "North", "insert")])
+
+    def test_compacts_to_slowest_consumer(self):
+        """Acked changes are dropped only once every consumer has applied them."""
+        seq = self.db.register_change_consumer("ui")
+        self.db.register_change_consumer("export")
+        self.db.add_sietch("North")
+        self.db.add_sietch("South")
+        changes = self.db.changes_since(seq)
+        self.db.ack_changes("ui", changes[-1][0])
+        self.assertEqual(len(self.db.changes_since(seq)), 2)
+        self.db.ack_changes("export", changes[0][0])
+        self.assertEqual([row[2] for row in self.db.changes_since(seq)], ["South"])
+        self.db.unregister_change_consumer("export")
+        self.assertEqual(self.db.changes_since(seq), [])
+
+
+class TestNameIndex(unittest.TestCase):
+    """The in-memory name index against the tables it mirrors, through every mutator."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.image_folder = os.path.join(self.folder.name, "screenshots")
+        self.db = DatabaseManager(os.path.join(self.folder.name, "tracker.db"), self.image_folder)
+        self.rng = np.random.default_rng(5)
+        self.minute = 0
+
+    def tearDown(self):
+        self.db.close()
+        self.folder.cleanup()
+
+    def save(self, sietch, location_id, object_id):
+        self.minute += 1
+        size = HealthAnalyzer.CROP_BOX_SIZE
+        data = {"sietch": sietch, "location_id": location_id, "object_id": object_id, "health": 50.0,
+                "timestamp": datetime(2026, 1, 1) + timedelta(minutes=self.minute),
+                "roi_image": self.rng.integers(0, 256, (size, size, 3), dtype=np.uint8)}
+        success, msg = self.db.save_data_point(data)
+        self.assertTrue(success, msg)
+
+    def assert_index_matches_tables(self):
+        locations = self.db.query("SELECT id, sietch_name, location_id FROM locations").fetchall()
+        objects = self.db.query("SELECT id, location_fk, object_id FROM objects").fetchall()
+        self.assertEqual(self.db._location_pks, {(sietch, location_id): pk for pk, sietch, location_id in locations})
+        self.assertEqual(self.db._location_keys, {pk: (sietch, location_id) for pk, sietch, location_id in locations})
+        object_pks = {pk: {} for pk, _, _ in locations}
+        for pk, loc_fk, object_id in objects: object_pks[loc_fk][object_id] = pk
+        self.assertEqual(self.db._object_pks, object_pks)
+        self.assertEqual(self.db._object_keys, {pk: (loc_fk, object_id) for pk, loc_fk, object_id in objects})
+        for pk, loc_fk, object_id in objects:
+            key = self.db.get_object_key(pk)
+            self.assertEqual(self.db.get_object_pk_by_name(*key), pk)
+            self.assertEqual(key[2], object_id)
+
+    def test_index_follows_mutators(self):
+        """Adds, renames, deletes, cascades and a shard round trip leave the index equal to the tables."""
+        for sietch in ("North", "South"):
+            self.db.add_sietch(sietch)
+            for location_id in ("A1", "B2", "C3"):
+                self.db.add_location(sietch, location_id)
+                for object_id in ("walls", "gate"): self.save(sietch, location_id, object_id)
+        self.db.add_location("North", "A1")
+        self.save("North", "A1", "walls")
+        self.assert_index_matches_tables()
+
+        self.db.add_sietch("East")
+        self.assertTrue(self.db.rename_sietch("East", "Far East")[0])
+        self.db.add_location("Far East", "D4")
+        self.save("Far East", "D4", "walls")
+        self.assertTrue(self.db.rename_location(self.db.get_location_pk_by_name("South", "A1"), "A9")[0])
+        walls = self.db.get_object_pk_by_name("South", "B2", "walls")
+        self.assertTrue(self.db.rename_object(walls, "tower")[0])
+        # Failed renames must not touch the index either.
+        self.assertFalse(self.db.rename_sietch("North", "South")[0])
+        # Locations reference the sietch name without ON UPDATE CASCADE, so one in use cannot be renamed.
+        self.assertFalse(self.db.rename_sietch("North", "Northwest")[0])
+        self.assertFalse(self.db.rename_location(self.db.get_location_pk_by_name("South", "A9"), "B2")[0])
+        self.assertFalse(self.db.rename_object(walls, "gate")[0])
+        self.assert_index_matches_tables()
+
+        self.db.delete_object(self.db.get_object_pk_by_name("South", "C3", "gate"))
+        self.db.delete_location(self.db.get_location_pk_by_name("North", "B2"))
+        self.assert_index_matches_tables()
+        self.db.delete_sietch("South")
+        self.assertIsNone(self.db.get_object_key(walls))
+        self.assert_index_matches_tables()
+
+        shard = os.path.join(self.folder.name, "north.db")
+        self.assertTrue(self.db.archive_sietch("North", shard)[0])
+        self.assertEqual([key[0] for key in self.db._location_keys.values()], ["Far East"])
+        self.assert_index_matches_tables()
+        self.assertTrue(self.db.import_sietch_shard(shard)[0])
+        self.assertIsNotNone(self.db.get_object_pk_by_name("North", "C3", "gate"))
+        self.assert_index_matches_tables()
+        self.save("North", "A1", "ramp")
+        self.assert_index_matches_tables()
+
+
+class TestMigration(unittest.TestCase):
+    """Opens a database in the original layout: REAL health_percent and absolute screenshot paths."""
+
+    # Values whose two-decimal REAL form is not exact in binary, plus the ends of the range.
+    HEALTHS = [57.35, 0.0, 100.0, 12.3, 66.67, 0.01, 99.99, 45.45, 8.05]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "tracker.db")
+        self.image_folder = os.path.join(self.folder.name, "screenshots")
+        self.outside = os.path.join(self.folder.name, "elsewhere", "shot.png")
+        conn = sqlite3.connect(self.path)
+        conn.execute('CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE sietches (name TEXT PRIMARY KEY)')
+        conn.execute('''CREATE TABLE locations (id INTEGER PRIMARY KEY, sietch_name TEXT, location_id TEXT, pin_x INTEGER, pin_y INTEGER, FOREIGN KEY(sietch_name) REFERENCES sietches(name) ON DELETE CASCADE, UNIQUE(sietch_name, location_id))''')
+        conn.execute('''CREATE TABLE objects (id INTEGER PRIMARY KEY, location_fk INTEGER, object_id TEXT, FOREIGN KEY(location_fk) REFERENCES locations(id) ON DELETE CASCADE, UNIQUE(location_fk, object_id))''')
+        conn.execute('''CREATE TABLE history (id INTEGER PRIMARY KEY, object_fk INTEGER, timestamp INTEGER, health_percent REAL, screenshot_path TEXT, FOREIGN KEY(object_fk) REFERENCES objects(id) ON DELETE CASCADE)''')
+        conn.execute("INSERT INTO sietches (name) VALUES ('North')")
+        conn.execute("INSERT INTO locations (id, sietch_name, location_id) VALUES (3, 'North', 'A1')")
+        conn.executemany("INSERT INTO objects (id, location_fk, object_id) VALUES (?, 3, ?)", [(5, "walls"), (9, "gate")])
+        self.rows = []
+        for n, health in enumerate(self.HEALTHS):
+            # Gaps in the ids, as left behind by deleted points.
+            history_id, obj_pk, ts = 10 + n * 7, (5, 9)[n % 2], 1_750_000_000 + n * 3600
+            path = os.path.join(self.image_folder, f"North_A1_{n}.png") if n % 3 else (self.outside if n == 3 else None)
+            self.rows.append((history_id, obj_pk, ts, health, path))
+        conn.executemany("INSERT INTO history (id, object_fk, timestamp, health_percent, screenshot_path) VALUES (?, ?, ?, ?, ?)", self.rows)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_baseline_schema_migrates(self):
+        """Health becomes exact hundredths, paths inside the image folder become relative, ids are kept."""
+        db = DatabaseManager(self.path, self.image_folder)
+        try:
+            self.assertEqual(db.query("PRAGMA user_version").fetchone()[0], DatabaseManager.SCHEMA_VERSION)
+            migrated = {history_id: rest for history_id, *rest in db.query("SELECT id, object_fk, timestamp, health_cp, image_ref FROM history")}
+            self.assertEqual(sorted(migrated), [row[0] for row in self.rows])
+            for history_id, obj_pk, ts, health, path in self.rows:
+                expected_ref = os.path.relpath(path, self.image_folder) if path and path != self.outside else path
+                self.assertEqual(migrated[history_id], [obj_pk, ts, round(health * 100), expected_ref], f"history {history_id}")
+                self.assertEqual(db.resolve_image_path(expected_ref), path)
+            self.assertEqual(db.get_history_arrays(5)['health'].tolist(), [row[3] for row in self.rows if row[1] == 5])
+            self.assertEqual(db.get_object_pk_by_name("North", "A1", "gate"), 9)
+        finally:
+            db.close()
+
+    def test_reopening_is_a_no_op(self):
+        """A second open of a migrated file changes nothing in it."""
+        DatabaseManager(self.path, self.image_folder).close()
+        conn = sqlite3.connect(self.path)
+        before = (conn.execute("PRAGMA user_version").fetchone(), list(conn.iterdump()))
+        conn.close()
+        DatabaseManager(self.path, self.image_folder).close()
+        conn = sqlite3.connect(self.path)
+        after = (conn.execute("PRAGMA user_version").fetchone(), list(conn.iterdump()))
+        conn.close()
+        self.assertEqual(after, before)
+
+if __name__ == '__main__':
+    unittest.main()
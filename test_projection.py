@@ -0,0 +1,118 @@
+import unittest
+import random
+import numpy as np
+
+from database import DatabaseManager
+from projection import ProjectionEngine, PriorityWatch
+
+class TestProjectionEngine(unittest.TestCase):
+
+    NOW_TS = 1_750_000_000.5
+
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.engine = ProjectionEngine()
+        self.db.add_sietch("Sietch")
+        self.db.add_location("Sietch", "A1")
+        loc_pk = self.db.get_location_pk_by_name("Sietch", "A1")
+        rng = random.Random(7)
+        # Health as the old REAL column held it: two decimals, as a Python float.
+        self.healths = {}
+        history_id = 0
+        for obj_pk in range(1, 61):
+            self.db.query("INSERT INTO objects (id, location_fk, object_id) VALUES (?, ?, ?)", (obj_pk, loc_pk, f"obj{obj_pk:02d}"))
+            ts, health = int(self.NOW_TS) - rng.randint(20, 200) * 3600, round(rng.uniform(40, 100), 2)
+            points = []
+            for _ in range(rng.randint(1, 8)):
+                points.append((ts, health))
+                ts += rng.randint(0, 30) * 600
+                # Mostly decaying, with the odd repair or repeated reading.
+                health = round(min(100.0, max(0.0, health - rng.choice([0, 0.5, 1.25, 3.3, 7.77, -4.01]))), 2)
+            for ts, health in points:
+                history_id += 1
+                self.db.query("INSERT INTO history (object_fk, timestamp, id, health_cp) VALUES (?, ?, ?, ?)",
+                              (obj_pk, ts, history_id, round(health * DatabaseManager.HEALTH_SCALE)))
+            self.healths[obj_pk] = points
+        self.db.commit()
+
+    def _old_projection(self, points):
+        """The per-object projection used before the vectorized engine, on float64 health."""
+        timestamps = np.array([ts for ts, _ in points], dtype=np.int64)
+        healths = [health for _, health in points]
+        if len(timestamps) < 2: return None
+        last_health = float(healths[-1])
+        time_delta_hours_lin = (timestamps[-1] - timestamps[-2]) / 3600
+        health_delta_lin = float(healths[-2]) - last_health
+        current_health_estimate = last_health
+        if time_delta_hours_lin > 0 and health_delta_lin > 0:
+            decay_rate_per_hour = health_delta_lin / time_delta_hours_lin
+            hours_since_last = (self.NOW_TS - timestamps[-1]) / 3600
+            current_health_estimate = max(0, last_health - (decay_rate_per_hour * hours_since_last))
+        if current_health_estimate <= 0: return None
+
+        time_elapsed_hours = float(timestamps[-1] - timestamps[0]) / 3600
+        if time_elapsed_hours <= 0: return None
+        estimated_scs = time_elapsed_hours / self.engine.avg_cycle_h
+        if estimated_scs <= 0: return None
+        total_damage = float(healths[0]) - float(healths[-1])
+        if total_damage <= 0: return None
+        dsc = total_damage / estimated_scs
+        if dsc <= 0: return None
+        remaining_scs = current_health_estimate / dsc
+        return {
+            "worst": remaining_scs * self.engine.min_interval_h,
+            "median": remaining_scs * self.engine.avg_cycle_h,
+            "latest": remaining_scs * self.engine.max_interval_h,
+        }
+
+    def test_health_is_float64(self):
+        """Health comes back as float64, equal to the two-decimal value that was saved."""
+        for arrays in (self.db.get_all_history_arrays(), self.db.get_history_arrays(1)):
+            self.assertEqual(arrays['health'].dtype, np.float64)
+        inputs = self.db.get_projection_inputs()
+        for name in ("first_health", "prev_health", "last_health"):
+            self.assertEqual(inputs[name].dtype, np.float64)
+        self.assertEqual(self.db.get_history_arrays(1)['health'].tolist(), [health for _, health in self.healths[1]])
+
+    def test_project_matches_per_object_formula(self):
+        """Vectorized projections equal the old per-object results exactly, NaN where it gave none."""
+        inputs = self.db.get_projection_inputs()
+        projections = self.engine.project(inputs, self.NOW_TS)
+        self.assertEqual(sorted(projections['object_pk'].tolist()), [pk for pk, points in self.healths.items() if len(points) >= 2])
+        compared = 0
+        for i, obj_pk in enumerate(projections['object_pk'].tolist()):
+            expected = self._old_projection(self.healths[obj_pk])
+            for key in ("worst", "median", "latest"):
+                if expected is None:
+                    self.assertTrue(np.isnan(projections[key][i]), f"object {obj_pk} {key}")
+                else:
+                    self.assertEqual(projections[key][i], expected[key], f"object {obj_pk} {key}")
+            compared += expected is not None
+        self.assertGreater(compared, 10)
+
+    def test_single_object_matches_batch(self):
+        """The graph's one-object path gives the same hours as the batch projection."""
+        projections = self.engine.project(self.db.get_projection_inputs(), self.NOW_TS)
+        for i, obj_pk in enumerate(projections['object_pk'].tolist()):
+            single = ProjectionEngine.inputs_from_history(self.db.get_history_arrays(obj_pk))
+            hours = self.engine.dsc_hours(single, self.engine.current_health(single, self.NOW_TS))
+            for key in ("worst", "median", "latest"):
+                if np.isnan(projections[key][i]): continue
+                self.assertEqual(hours[key][0], projections[key][i])
+
+class TestPriorityWatch(unittest.TestCase):
+
+    def test_ties_keep_row_order(self):
+        """Equal times are listed, and cut at the list size, in row order like the old sorted list."""
+        rng = np.random.default_rng(3)
+        watch = PriorityWatch(size=10)
+        for _ in range(200):
+            n = int(rng.integers(1, 40))
+            hours = rng.choice([np.nan, -1.0, 5.0, 7.0, 9.0, 12.0], size=n)
+            projections = {"worst": hours, "current_health": np.full(n, 50.0), "decay_rate": rng.choice([0.0, 0.5, 1.0], size=n)}
+            rows, _ = watch.update(projections)
+            expected = sorted((i for i in range(n) if hours[i] > 0), key=lambda i: (hours[i], i))[:10]
+            self.assertEqual(rows.tolist(), expected)
+
+if __name__ == '__main__':
+    unittest.main()